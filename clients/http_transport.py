@@ -0,0 +1,176 @@
+import threading
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import Config
+from utils.helpers import log
+
+try:
+    import httpx
+except ImportError:  # HTTP/2 is optional
+    httpx = None
+
+
+class _Http2Response:
+    """Wraps an httpx response with the parts of the requests API the clients use"""
+
+    def __init__(self, res):
+        self._res = res
+        self.status_code = res.status_code
+        self.headers = res.headers
+        self.url = str(res.url)
+
+    @property
+    def ok(self):
+        return self._res.is_success
+
+    @property
+    def reason(self):
+        return self._res.reason_phrase
+
+    @property
+    def text(self):
+        return self._res.text
+
+    @property
+    def content(self):
+        return self._res.content
+
+    def json(self):
+        return self._res.json()
+
+    def raise_for_status(self):
+        try:
+            self._res.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            raise requests.exceptions.HTTPError(str(e), response=self) from e
+
+    def iter_content(self, chunk_size=1024):
+        return self._res.iter_bytes(chunk_size)
+
+    def iter_lines(self):
+        try:
+            for line in self._res.iter_lines():
+                yield line.encode()
+        except httpx.TransportError as e:
+            raise requests.exceptions.ConnectionError(str(e)) from e
+
+    def close(self):
+        self._res.close()
+
+
+class HttpTransport:
+    """
+    Shared keep-alive HTTP transport for all API clients.
+
+    One requests.Session with a connection pool per host (or one httpx client
+    when HTTP/2 is enabled), plus per-host request/connection counters so the
+    handshake savings can be checked under load.
+    """
+
+    def __init__(self, pool_connections=None, pool_maxsize=None, http2=None):
+        self.pool_connections = pool_connections or Config.HTTP_POOL_CONNECTIONS
+        self.pool_maxsize = pool_maxsize or Config.HTTP_POOL_MAXSIZE
+        http2 = Config.HTTP2 if http2 is None else http2
+        if http2 and httpx is None:
+            log("⚠️ HTTP2 is enabled but httpx is not installed, falling back to HTTP/1.1")
+        self.http2 = http2 and httpx is not None
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize, pool_block=False)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.adapter = adapter
+
+        self._http2_clients = {}
+        self._lock = threading.Lock()
+        self._requests = defaultdict(int)
+
+    def _http2_client(self, verify):
+        with self._lock:
+            client = self._http2_clients.get(verify)
+            if client is None:
+                limits = httpx.Limits(
+                    max_connections=self.pool_connections * self.pool_maxsize,
+                    max_keepalive_connections=self.pool_maxsize,
+                )
+                client = httpx.Client(http2=True, verify=verify, limits=limits)
+                self._http2_clients[verify] = client
+            return client
+
+    def _send_http2(self, method, url, verify=True, stream=False, files=None, data=None, **kwargs):
+        client = self._http2_client(verify)
+        if hasattr(data, "read"):
+            kwargs["content"] = iter(lambda: data.read(64 * 1024), b"")
+        elif data is not None:
+            kwargs["data"] = data
+        if files is not None:
+            kwargs["files"] = files
+        timeout = kwargs.get("timeout")
+        if isinstance(timeout, tuple):
+            kwargs["timeout"] = httpx.Timeout(timeout[1], connect=timeout[0])
+        req = client.build_request(method.upper(), url, **{k: v for k, v in kwargs.items() if k != "auth"})
+        # Surface httpx failures as the requests exceptions the clients already handle
+        try:
+            res = client.send(req, auth=kwargs.get("auth"), stream=stream)
+        except httpx.TimeoutException as e:
+            raise requests.exceptions.Timeout(str(e)) from e
+        except httpx.TransportError as e:
+            raise requests.exceptions.ConnectionError(str(e)) from e
+        return _Http2Response(res)
+
+    def request(self, method, url, **kwargs):
+        """Send one request over the shared pools and return a requests-style response"""
+        host = urlsplit(url).netloc
+        with self._lock:
+            self._requests[host] += 1
+        if self.http2:
+            return self._send_http2(method, url, **kwargs)
+        return self.session.request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request("get", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("post", url, **kwargs)
+
+    def stats(self):
+        """Per-host requests vs. new connections; reused = requests that skipped a handshake"""
+        result = {host: {"requests": count, "connections": None, "reused": None} for host, count in self._requests.items()}
+        if self.http2:
+            return result
+
+        pools = self.adapter.poolmanager.pools
+        with pools.lock:
+            live = list(pools._container.values())
+        for pool in live:
+            host = pool.host if pool.port in (None, 80, 443) else f"{pool.host}:{pool.port}"
+            entry = result.setdefault(host, {"requests": 0, "connections": None, "reused": None})
+            entry["connections"] = (entry["connections"] or 0) + pool.num_connections
+            entry["reused"] = max(0, (entry["reused"] or 0) + pool.num_requests - pool.num_connections)
+        return result
+
+    def log_stats(self):
+        for host, s in self.stats().items():
+            log(f"[http] {host}: requests={s['requests']} connections={s['connections']} reused={s['reused']}")
+
+    def close(self):
+        self.session.close()
+        for client in self._http2_clients.values():
+            client.close()
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def get_transport():
+    """Process-wide transport shared by every client"""
+    global _transport
+    with _transport_lock:
+        if _transport is None:
+            _transport = HttpTransport()
+        return _transport
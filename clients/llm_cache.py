@@ -0,0 +1,161 @@
+import copy
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import redis
+
+from config import Config
+from utils.helpers import log
+
+
+class LLMCache:
+    """
+    Content-addressed cache of chat completions.
+
+    Keys are a SHA-256 of (model, messages, max_tokens). Volatile prompt
+    fragments (today's date, request ids, ...) are removed before hashing so
+    they don't defeat the cache. Responses live in an in-memory LRU and in
+    Redis with a TTL; the Redis tier keeps at most `redis_max_entries` keys,
+    evicting the oldest through a sorted-set index.
+    """
+
+    def __init__(self, max_size=None, ttl=None, redis_max_entries=None, volatile_patterns=None, redis_client=None):
+        self.max_size = max_size or Config.LLM_CACHE_SIZE
+        self.ttl = ttl or Config.LLM_CACHE_TTL
+        self.redis_max_entries = redis_max_entries or Config.LLM_CACHE_REDIS_MAX
+        patterns = volatile_patterns if volatile_patterns is not None else Config.LLM_CACHE_VOLATILE_PATTERNS
+        self.volatile_patterns = [re.compile(p) for p in patterns if p]
+        if redis_client is None and Config.REDIS_URL:
+            redis_client = redis.Redis.from_url(Config.REDIS_URL)
+        self.redis = redis_client
+        self.index_key = "llm_cache:index"
+
+        self.local = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    def _strip_volatile(self, text, volatile):
+        for fragment in volatile or []:
+            if fragment:
+                text = text.replace(str(fragment), "")
+        for pattern in self.volatile_patterns:
+            text = pattern.sub("", text)
+        return text
+
+    def key(self, model, messages, max_tokens, volatile=None):
+        normalized = [
+            {
+                "role": m.get("role"),
+                "content": self._strip_volatile(m["content"], volatile) if isinstance(m.get("content"), str) else m.get("content"),
+            }
+            for m in messages
+        ]
+        raw = json.dumps([model, normalized, max_tokens], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def _remember(self, key, response):
+        with self.lock:
+            self.local[key] = response
+            self.local.move_to_end(key)
+            while len(self.local) > self.max_size:
+                self.local.popitem(last=False)
+
+    def get(self, key):
+        with self.lock:
+            if key in self.local:
+                self.local.move_to_end(key)
+                self.hits += 1
+                return copy.deepcopy(self.local[key])
+
+        if self.redis is not None:
+            try:
+                raw = self.redis.get(f"llm_cache:{key}")
+            except redis.exceptions.RedisError as e:
+                log(f"[LLMCache] Redis get error: {e}")
+                raw = None
+            if raw is not None:
+                response = json.loads(raw)
+                self._remember(key, response)
+                with self.lock:
+                    self.redis_hits += 1
+                return copy.deepcopy(response)
+
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, response):
+        self._remember(key, copy.deepcopy(response))
+        if self.redis is None:
+            return
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.set(f"llm_cache:{key}", json.dumps(response, ensure_ascii=False), ex=self.ttl)
+            pipe.zadd(self.index_key, {key: time.time()})
+            pipe.zcard(self.index_key)
+            size = pipe.execute()[-1]
+
+            if size > self.redis_max_entries:
+                evicted = self.redis.zpopmin(self.index_key, size - self.redis_max_entries)
+                if evicted:
+                    self.redis.delete(*[f"llm_cache:{k.decode()}" for k, _ in evicted])
+        except redis.exceptions.RedisError as e:
+            log(f"[LLMCache] Redis set error: {e}")
+
+    def delete(self, key):
+        """Drop a response, e.g. one the caller could not use"""
+        with self.lock:
+            self.local.pop(key, None)
+        if self.redis is None:
+            return
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.delete(f"llm_cache:{key}")
+            pipe.zrem(self.index_key, key)
+            pipe.execute()
+        except redis.exceptions.RedisError as e:
+            log(f"[LLMCache] Redis delete error: {e}")
+
+    def record_bypass(self):
+        with self.lock:
+            self.bypassed += 1
+
+    def stats(self):
+        total = self.hits + self.redis_hits + self.misses
+        return {
+            "hits": self.hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_rate": round((self.hits + self.redis_hits) / total, 3) if total else 0.0,
+            "size": len(self.local),
+        }
+
+    def log_stats(self):
+        s = self.stats()
+        log(
+            f"[LLMCache] hits={s['hits']} redis_hits={s['redis_hits']} misses={s['misses']} "
+            f"bypassed={s['bypassed']} hit_rate={s['hit_rate']} size={s['size']}"
+        )
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache():
+    """Process-wide LLM cache, or None when LLM_CACHE is disabled"""
+    global _cache
+    if not Config.LLM_CACHE:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMCache()
+        return _cache
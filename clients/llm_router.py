@@ -0,0 +1,181 @@
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from config import Config
+from utils.helpers import log
+
+
+class LatencyTracker:
+    """Rolling window of completion latencies per model"""
+
+    def __init__(self, window=None, min_samples=None):
+        self.window = window or Config.LLM_LATENCY_WINDOW
+        self.min_samples = min_samples or Config.LLM_HEDGE_MIN_SAMPLES
+        self.samples = defaultdict(lambda: deque(maxlen=self.window))
+        self.lock = threading.Lock()
+
+    def record(self, model, seconds):
+        with self.lock:
+            self.samples[model].append(seconds)
+
+    def percentile(self, model, q):
+        """The q-th percentile (0-1) of the model's recent latencies, or None until min_samples are in"""
+        with self.lock:
+            values = sorted(self.samples[model])
+        if len(values) < self.min_samples:
+            return None
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class Attempt:
+    """One streamed completion; cancel() closes its HTTP response from another thread"""
+
+    def __init__(self, model):
+        self.model = model
+        self.cancelled = threading.Event()
+        self.response = None
+
+    def on_response(self, response):
+        self.response = response
+        if self.cancelled.is_set():
+            response.close()
+
+    def cancel(self):
+        self.cancelled.set()
+        if self.response is not None:
+            self.response.close()
+
+
+class LLMRouter:
+    """
+    Hedged chat completions with model fallback.
+
+    A call goes to the requested model. If it has not answered after that
+    model's rolling p95 latency, a duplicate request is sent to the first
+    fallback model (or the same model when none is configured); whichever
+    completes first wins and the other is cancelled by closing its stream.
+    Hedges are paid from a budget that earns Config.LLM_HEDGE_BUDGET of a
+    hedge per call, so at most that fraction of calls is duplicated. A call
+    that fails outright is retried once on the first untried fallback model.
+    """
+
+    def __init__(self, fallback_models=None, budget=None, workers=None):
+        self.fallback_models = fallback_models if fallback_models is not None else Config.LLM_FALLBACK_MODELS
+        self.budget = Config.LLM_HEDGE_BUDGET if budget is None else budget
+        self.pool = ThreadPoolExecutor(max_workers=workers or Config.LLM_ROUTER_WORKERS, thread_name_prefix="llm")
+        self.latency = LatencyTracker()
+        self.lock = threading.Lock()
+        self.credits = 1.0
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.fallbacks = 0
+
+    def _run(self, client, attempt, messages, max_tokens):
+        start = time.monotonic()
+        parts = []
+        stream = client.chat_stream(messages, model=attempt.model, max_tokens=max_tokens, on_response=attempt.on_response)
+        try:
+            for delta in stream:
+                if attempt.cancelled.is_set():
+                    return None
+                parts.append(delta)
+        except Exception:
+            if attempt.cancelled.is_set():
+                return None  # closed under us by cancel()
+            raise
+        finally:
+            stream.close()
+        if attempt.cancelled.is_set():
+            return None  # a closed stream can also just end; its latency would be truncated
+        self.latency.record(attempt.model, time.monotonic() - start)
+        return {"model": attempt.model, "choices": [{"message": {"role": "assistant", "content": "".join(parts)}}]}
+
+    def _spend_hedge(self):
+        with self.lock:
+            if self.credits < 1:
+                return False
+            self.credits -= 1
+            self.hedges += 1
+            return True
+
+    def chat(self, client, messages, model, max_tokens):
+        with self.lock:
+            self.calls += 1
+            self.credits = min(self.credits + self.budget, 10.0)
+
+        start = time.monotonic()
+        primary = Attempt(model)
+        running = {self.pool.submit(self._run, client, primary, messages, max_tokens): primary}
+        tried = [model]
+        error = None
+
+        hedge_after = self.latency.percentile(model, 0.95)
+        if hedge_after is not None:
+            done, _ = wait(running, timeout=hedge_after)
+            if not done and self._spend_hedge():
+                hedge_model = self.fallback_models[0] if self.fallback_models else model
+                log(f"[LLMRouter] {model} slower than p95 ({hedge_after:.1f}s), hedging on {hedge_model}")
+                hedge = Attempt(hedge_model)
+                running[self.pool.submit(self._run, client, hedge, messages, max_tokens)] = hedge
+                tried.append(hedge_model)
+
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                attempt = running.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    error = e
+                    log(f"[LLMRouter] {attempt.model} failed: {e}")
+                    continue
+                for other in running.values():
+                    other.cancel()
+                if attempt is not primary:
+                    with self.lock:
+                        self.hedge_wins += 1
+                    if primary in running.values():
+                        # Lost the race: it took at least this long, so keep it in the p95
+                        self.latency.record(model, time.monotonic() - start)
+                return result
+
+        fallback = next((m for m in self.fallback_models if m not in tried), None)
+        if fallback is None:
+            raise error
+        with self.lock:
+            self.fallbacks += 1
+        log(f"[LLMRouter] falling back to {fallback}")
+        return self._run(client, Attempt(fallback), messages, max_tokens)
+
+    def stats(self):
+        models = {}
+        with self.latency.lock:
+            names = list(self.latency.samples)
+        for model in names:
+            p50 = self.latency.percentile(model, 0.5)
+            p95 = self.latency.percentile(model, 0.95)
+            models[model] = f"p50={p50:.1f}s p95={p95:.1f}s" if p95 is not None else "warming up"
+        return {"calls": self.calls, "hedges": self.hedges, "hedge_wins": self.hedge_wins, "fallbacks": self.fallbacks, "models": models}
+
+    def log_stats(self):
+        s = self.stats()
+        models = " | ".join(f"{m}: {v}" for m, v in s["models"].items())
+        log(f"[LLMRouter] calls={s['calls']} hedges={s['hedges']} hedge_wins={s['hedge_wins']} fallbacks={s['fallbacks']} | {models}")
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_llm_router():
+    """Process-wide LLM router, or None when LLM_HEDGING is disabled"""
+    global _router
+    if not Config.LLM_HEDGING:
+        return None
+    with _router_lock:
+        if _router is None:
+            _router = LLMRouter()
+        return _router
@@ -0,0 +1,196 @@
+import argparse
+import hashlib
+import json
+import time
+from urllib.parse import urlsplit
+
+import redis
+
+from config import Config
+from utils.helpers import log
+
+
+def site_id(url=None):
+    parts = urlsplit(url or Config.WORDPRESS_URL or "")
+    return f"{parts.netloc}{parts.path.rstrip('/')}"
+
+
+class MediaRegistry:
+    """
+    Content-hash registry of uploaded media for one WordPress site.
+
+    Redis hash media_registry:<site> maps the SHA-256 of an image's bytes to
+    {"id", "source_url", "verified"}. Before uploading, clients look the hash
+    up; a hit is only trusted once the media item is confirmed to still exist
+    (at most every Config.MEDIA_VERIFY_TTL seconds), otherwise the entry is
+    dropped and the image uploaded again.
+    """
+
+    def __init__(self, site=None, redis_client=None, verify_ttl=None):
+        self.site = site or site_id()
+        self.key = f"media_registry:{self.site}"
+        self.verify_ttl = Config.MEDIA_VERIFY_TTL if verify_ttl is None else verify_ttl
+        if redis_client is None and Config.REDIS_URL:
+            redis_client = redis.Redis.from_url(Config.REDIS_URL)
+        self.redis = redis_client
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    @staticmethod
+    def hash_bytes(data):
+        return hashlib.sha256(data).hexdigest()
+
+    @staticmethod
+    def hash_file(path, chunk_size=64 * 1024):
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def get(self, sha):
+        if self.redis is None:
+            return None
+        try:
+            value = self.redis.hget(self.key, sha)
+        except redis.exceptions.RedisError as e:
+            log(f"[MediaRegistry] Redis read failed: {e}")
+            return None
+        return json.loads(value) if value else None
+
+    def put(self, sha, media_id, source_url=None, verified=None):
+        if self.redis is None:
+            return
+        entry = {"id": media_id, "source_url": source_url, "verified": verified or time.time()}
+        try:
+            self.redis.hset(self.key, sha, json.dumps(entry))
+        except redis.exceptions.RedisError as e:
+            log(f"[MediaRegistry] Redis write failed: {e}")
+
+    def forget(self, sha):
+        if self.redis is not None:
+            try:
+                self.redis.hdel(self.key, sha)
+            except redis.exceptions.RedisError as e:
+                log(f"[MediaRegistry] Redis delete failed: {e}")
+
+    def lookup(self, sha, fetch_media):
+        """
+        The registered media for `sha` if it still exists, else None.
+        fetch_media(media_id) returns the media JSON, or None when it was deleted.
+        """
+        entry = self.get(sha)
+        if entry is None:
+            self.misses += 1
+            return None
+        if time.time() - entry.get("verified", 0) < self.verify_ttl:
+            self.hits += 1
+            return entry
+        try:
+            media = fetch_media(entry["id"])
+        except Exception as e:
+            # can't tell whether it still exists: upload again rather than attach a dead id
+            log(f"[MediaRegistry] Could not verify media {entry['id']}: {e}")
+            self.misses += 1
+            return None
+        if not media:
+            log(f"[MediaRegistry] Media {entry['id']} no longer exists, forgetting it")
+            self.forget(sha)
+            self.stale += 1
+            return None
+        self.put(sha, entry["id"], media.get("source_url") or entry.get("source_url"))
+        self.hits += 1
+        return self.get(sha) or entry
+
+    def upload_once(self, sha, upload, fetch_media):
+        """
+        Return {"id", "source_url", "reused"} for content `sha`: the registered media
+        when it still exists, otherwise upload() -> media JSON (or None), registered.
+        """
+        entry = self.lookup(sha, fetch_media)
+        if entry is not None:
+            return {"id": entry["id"], "source_url": entry.get("source_url"), "reused": True}
+        media = upload()
+        if not media:
+            return None
+        self.put(sha, media["id"], media.get("source_url"))
+        return {"id": media["id"], "source_url": media.get("source_url"), "reused": False}
+
+    def entries(self):
+        if self.redis is None:
+            return
+        for sha, value in self.redis.hscan_iter(self.key):
+            yield sha.decode(), json.loads(value)
+
+    def stats(self):
+        size = self.redis.hlen(self.key) if self.redis is not None else 0
+        return {"site": self.site, "entries": size, "hits": self.hits, "misses": self.misses, "stale": self.stale}
+
+    def log_stats(self):
+        s = self.stats()
+        log(f"[MediaRegistry] {s['site']}: {s['entries']} entries | hits={s['hits']} misses={s['misses']} stale={s['stale']}")
+
+
+def _verify(registry, client):
+    """Drop every entry whose media item is gone"""
+    dropped = 0
+    for sha, entry in list(registry.entries()):
+        try:
+            exists = client.get_media(entry["id"])
+        except Exception as e:
+            log(f"[MediaRegistry] Skipping {entry['id']}: {e}")
+            continue
+        if not exists:
+            registry.forget(sha)
+            dropped += 1
+    log(f"[MediaRegistry] Verified registry, dropped {dropped} missing media")
+
+
+def _rebuild(registry, client):
+    """Hash every image in the media library and register it"""
+    added = 0
+    for media in client.iter_media():
+        url = media.get("source_url")
+        if not url or not (media.get("mime_type") or "").startswith("image/"):
+            continue
+        try:
+            res = client.http.get(url, stream=True, timeout=Config.TIMEOUT)
+            res.raise_for_status()
+            digest = hashlib.sha256()
+            for chunk in res.iter_content(64 * 1024):
+                digest.update(chunk)
+            res.close()
+        except Exception as e:
+            log(f"[MediaRegistry] Could not download media {media['id']}: {e}")
+            continue
+        registry.put(digest.hexdigest(), media["id"], url)
+        added += 1
+    log(f"[MediaRegistry] Rebuilt registry from the media library: {added} images")
+
+
+if __name__ == "__main__":
+    from clients.wordpress_client import WordPressClient
+
+    parser = argparse.ArgumentParser(description="Media dedup registry maintenance")
+    parser.add_argument("command", choices=["stats", "verify", "evict", "rebuild"])
+    parser.add_argument("--sha", help="evict this content hash")
+    parser.add_argument("--media-id", type=int, help="evict entries pointing at this media id")
+    parser.add_argument("--all", action="store_true", help="evict every entry of the site")
+    args = parser.parse_args()
+
+    registry = MediaRegistry()
+    if args.command == "stats":
+        print(json.dumps(registry.stats(), indent=2))
+    elif args.command == "verify":
+        _verify(registry, WordPressClient())
+    elif args.command == "rebuild":
+        _rebuild(registry, WordPressClient())
+    elif args.all:
+        registry.redis.delete(registry.key)
+        log(f"[MediaRegistry] Cleared {registry.key}")
+    else:
+        for sha, entry in list(registry.entries()):
+            if sha == args.sha or (args.media_id and entry["id"] == args.media_id):
+                registry.forget(sha)
+                log(f"[MediaRegistry] Evicted {sha} -> {entry['id']}")
@@ -0,0 +1,93 @@
+import mimetypes
+import os
+import uuid
+
+
+class MultipartFile:
+    """
+    multipart/form-data body that streams one file from disk.
+
+    Behaves as a read-only file object: requests (and the HTTP/2 transport)
+    pull it in small chunks, so only a chunk of the file is in memory at a time.
+    It knows its total length for Content-Length, and seek(0) rewinds it so the
+    retry policy can send it again without rebuilding anything.
+    """
+
+    def __init__(self, path, field="file", filename=None, content_type=None, fields=None, chunk_size=64 * 1024):
+        self.path = path
+        self.filename = filename or os.path.basename(path)
+        self.content_type = content_type or mimetypes.guess_type(self.filename)[0] or "application/octet-stream"
+        self.boundary = uuid.uuid4().hex
+        self.chunk_size = chunk_size
+
+        head = b""
+        for name, value in (fields or {}).items():
+            head += (
+                f'--{self.boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+            ).encode()
+        head += (
+            f'--{self.boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{self.filename}"\r\n'
+            f"Content-Type: {self.content_type}\r\n\r\n"
+        ).encode()
+        self.head = head
+        self.tail = f"\r\n--{self.boundary}--\r\n".encode()
+        self.file_size = os.path.getsize(path)
+        self.length = len(self.head) + self.file_size + len(self.tail)
+        self.file = None
+        self.pos = 0
+
+    @property
+    def headers(self):
+        return {
+            "Content-Type": f"multipart/form-data; boundary={self.boundary}",
+            "Content-Length": str(self.length),
+        }
+
+    def __len__(self):
+        return self.length
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=0):
+        if (offset, whence) != (0, 0):
+            raise ValueError("MultipartFile can only be rewound to the start")
+        self.pos = 0
+        if self.file:
+            self.file.seek(0)
+        return 0
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.length - self.pos
+        size = min(size, self.chunk_size)
+        out = b""
+        while len(out) < size and self.pos < self.length:
+            want = size - len(out)
+            file_end = len(self.head) + self.file_size
+            if self.pos < len(self.head):
+                piece = self.head[self.pos:self.pos + want]
+            elif self.pos < file_end:
+                if self.file is None:
+                    self.file = open(self.path, "rb")
+                    self.file.seek(self.pos - len(self.head))
+                piece = self.file.read(min(want, file_end - self.pos))
+                if not piece:
+                    raise IOError(f"{self.path} shrank while uploading")
+            else:
+                start = self.pos - file_end
+                piece = self.tail[start:start + want]
+            out += piece
+            self.pos += len(piece)
+        return out
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
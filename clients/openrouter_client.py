@@ -1,5 +1,32 @@
+import json
+import time
+
 import requests
+
 from config import Config
+from clients.http_transport import get_transport
+from clients.llm_cache import get_llm_cache
+from clients.llm_router import get_llm_router
+from clients.retry_policy import get_retry_policy
+
+
+class StreamStalledError(requests.exceptions.Timeout):
+    """No tokens arrived on a streamed completion for longer than the stall timeout"""
+
+
+def _set_read_timeout(response, seconds):
+    """Change the socket read timeout of an open requests response (no-op over HTTP/2)"""
+    connection = getattr(getattr(response, "raw", None), "_connection", None)
+    sock = getattr(connection, "sock", None)
+    if sock is not None:
+        sock.settimeout(seconds)
+
+
+def _cacheable(res):
+    """Only completions with actual text are worth caching"""
+    choices = res.get("choices") or []
+    return bool(choices and (choices[0].get("message") or {}).get("content"))
+
 
 class OpenRouterClient:
     BASE = "https://openrouter.ai/api/v1"
@@ -8,19 +35,116 @@ class OpenRouterClient:
         self.api_key = api_key or Config.OPENROUTER_API_KEY
         self.verify_ssl = verify_ssl
         self.headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+        self.http = get_transport()
+        self.cache = get_llm_cache()
+        self.router = get_llm_router()
+        self.retry = get_retry_policy()
+
+    def chat(self, messages, model="gpt-4o-mini", max_tokens=500, use_cache=True, volatile=None, stream=False, on_delta=None):
+        """
+        use_cache=False bypasses the response cache for this call.
+        volatile: prompt fragments (e.g. today's date) ignored when computing the cache key.
+        stream=True reads the completion as SSE (with stall detection) and calls
+        on_delta(text) for every chunk; the return value has the same shape either way.
+        With LLM_HEDGING on, non-streamed calls go through the router (hedging, fallback models).
+        """
+        key = None
+        if self.cache is not None:
+            if use_cache:
+                key = self.cache.key(model, messages, max_tokens, volatile)
+                cached = self.cache.get(key)
+                if cached is not None:
+                    if on_delta:
+                        on_delta(cached["choices"][0]["message"]["content"])
+                    return cached
+            else:
+                self.cache.record_bypass()
+
+        if stream:
+            parts = []
+            for delta in self.chat_stream(messages, model=model, max_tokens=max_tokens):
+                parts.append(delta)
+                if on_delta:
+                    on_delta(delta)
+            res = {"model": model, "choices": [{"message": {"role": "assistant", "content": "".join(parts)}}]}
+            if key is not None and _cacheable(res):
+                self.cache.set(key, res)
+            return res
+
+        if self.router is not None:
+            res = self.router.chat(self, messages, model, max_tokens)
+            if key is not None and _cacheable(res):
+                self.cache.set(key, res)
+            return res
 
-    def chat(self, messages, model="gpt-4o-mini", max_tokens=500):
         url = f"{self.BASE}/chat/completions"
         payload = {"model": model, "messages": messages, "max_tokens": max_tokens}
-        for i in range(Config.MAX_RETRIES):
-            r = requests.post(url, json=payload, headers=self.headers, timeout=Config.TIMEOUT, verify=self.verify_ssl)
-            if r.ok: return r.json()
+        r = self.retry.send(self.http, "post", url, json=payload, headers=self.headers, timeout=Config.TIMEOUT, verify=self.verify_ssl)
         r.raise_for_status()
+        res = r.json()
+        if key is not None and _cacheable(res):
+            self.cache.set(key, res)
+        return res
+
+    def uncache(self, messages, model="gpt-4o-mini", max_tokens=500, volatile=None):
+        """Forget the cached answer to this call (e.g. it could not be parsed), so the next call asks again"""
+        if self.cache is not None:
+            self.cache.delete(self.cache.key(model, messages, max_tokens, volatile))
+
+    def chat_stream(self, messages, model="gpt-4o-mini", max_tokens=500, stall_timeout=None, on_response=None):
+        """
+        Yield the completion text chunk by chunk from the SSE stream.
+        Raises StreamStalledError when no token arrives for `stall_timeout` seconds
+        (Config.LLM_STREAM_STALL_TIMEOUT), instead of waiting for Config.TIMEOUT.
+        on_response(response) gets the open response, so another thread can close it to cancel.
+        """
+        stall_timeout = stall_timeout or Config.LLM_STREAM_STALL_TIMEOUT
+        url = f"{self.BASE}/chat/completions"
+        payload = {"model": model, "messages": messages, "max_tokens": max_tokens, "stream": True}
+
+        r = self.retry.send(
+            self.http, "post", url, json=payload, headers=self.headers, stream=True,
+            timeout=Config.TIMEOUT, verify=self.verify_ssl
+        )
+        if not r.ok:
+            r.close()
+            r.raise_for_status()
+        if on_response:
+            on_response(r)
+
+        # Before the first token the model may still be queued: allow the full timeout, then stall_timeout
+        # (checked per line for keep-alives, and as the socket read timeout for silence)
+        last_token = time.monotonic()
+        limit = Config.TIMEOUT
+        try:
+            for line in r.iter_lines():
+                if time.monotonic() - last_token > limit:
+                    raise StreamStalledError(f"No tokens for {limit}s on streamed completion ({model})")
+                if not line or not line.startswith(b"data:"):
+                    continue  # blank separators and ": keep-alive" comments
+                data = line[5:].strip()
+                if data == b"[DONE]":
+                    return
+                chunk = json.loads(data)
+                if chunk.get("error"):
+                    raise requests.exceptions.HTTPError(f"Stream error: {chunk['error']}")
+                choices = chunk.get("choices") or [{}]
+                delta = (choices[0].get("delta") or {}).get("content")
+                if delta:
+                    last_token = time.monotonic()
+                    if limit != stall_timeout:
+                        limit = stall_timeout
+                        _set_read_timeout(r, stall_timeout)
+                    yield delta
+        except requests.exceptions.ConnectionError as e:
+            # requests reports a read timeout mid-stream as ConnectionError
+            raise StreamStalledError(f"Stream stalled or dropped ({model}): {e}") from e
+        finally:
+            r.close()
 
     def generate_image(self, prompt, model="dall-e-3", size="1792x1024"):
         url = f"{self.BASE}/images/generate"
         payload = {"model": model, "prompt": prompt, "size": size}
-        for i in range(Config.MAX_RETRIES):
-            r = requests.post(url, json=payload, headers=self.headers, timeout=Config.TIMEOUT, verify=self.verify_ssl)
-            if r.ok: return r.json()
+        r = self.retry.send(self.http, "post", url, json=payload, headers=self.headers, timeout=Config.TIMEOUT, verify=self.verify_ssl)
         r.raise_for_status()
+        return r.json()
@@ -0,0 +1,177 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import requests
+
+from config import Config
+from utils.helpers import log
+
+# Statuses that may succeed when retried; any other 4xx is returned to the caller at once
+RETRYABLE_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """The host failed repeatedly and is not being called until its breaker resets"""
+
+    def __init__(self, host, retry_in):
+        super().__init__(f"Circuit open for {host}, retry in {retry_in:.0f}s")
+        self.host = host
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    Per-host breaker: opens after `failure_threshold` consecutive failures,
+    rejects calls for `reset_timeout` seconds, then lets one probe through
+    (half-open) and closes again on success.
+    """
+
+    def __init__(self, host, failure_threshold=None, reset_timeout=None):
+        self.host = host
+        self.failure_threshold = failure_threshold or Config.CIRCUIT_FAILURE_THRESHOLD
+        self.reset_timeout = reset_timeout or Config.CIRCUIT_RESET_TIMEOUT
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0 or self.probing:
+                raise CircuitOpenError(self.host, max(remaining, 1))
+            self.probing = True  # half-open: this caller is the probe
+
+    def check(self):
+        """Raise CircuitOpenError while the breaker is open, without taking the probe"""
+        with self.lock:
+            if self.opened_at is None:
+                return
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0 or self.probing:
+                raise CircuitOpenError(self.host, max(remaining, 1))
+
+    def release_probe(self):
+        """The probe ended without telling anything about the host; let the next call probe"""
+        with self.lock:
+            self.probing = False
+
+    def record_success(self):
+        with self.lock:
+            if self.opened_at is not None:
+                log(f"[circuit] {self.host} recovered, closing breaker")
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.probing or (self.opened_at is None and self.failures >= self.failure_threshold):
+                log(f"[circuit] {self.host} failing ({self.failures} in a row), opening breaker for {self.reset_timeout}s")
+                self.opened_at = time.monotonic()
+            self.probing = False
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(url):
+    host = urlsplit(url).netloc
+    with _breakers_lock:
+        if host not in _breakers:
+            _breakers[host] = CircuitBreaker(host)
+        return _breakers[host]
+
+
+class RetryPolicy:
+    """
+    Shared retry policy for API clients: exponential backoff with full jitter,
+    Retry-After support, retries only for RETRYABLE_STATUSES and network errors,
+    and a per-host circuit breaker.
+    """
+
+    def __init__(self, max_retries=None, base_delay=None, max_delay=None, retry_statuses=None):
+        self.max_retries = max_retries or Config.MAX_RETRIES
+        self.base_delay = base_delay or Config.RETRY_BASE_DELAY
+        self.max_delay = max_delay or Config.RETRY_MAX_DELAY
+        self.retry_statuses = retry_statuses or RETRYABLE_STATUSES
+
+    @staticmethod
+    def retry_after(res):
+        """Seconds from a Retry-After header (delta-seconds or HTTP date), or None"""
+        value = res.headers.get("Retry-After") if res is not None else None
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    def delay(self, attempt, res=None):
+        server_delay = self.retry_after(res)
+        if server_delay is not None:
+            return min(server_delay, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def send(self, transport, method, url, **kwargs):
+        """
+        Send through `transport` with retries. Returns the last response (which may be
+        a non-retryable error status for the caller to handle); raises CircuitOpenError
+        when the host's breaker is open, or the network error of the last attempt.
+        """
+        breaker = get_breaker(url)
+        body = kwargs.get("data")
+        for attempt in range(self.max_retries):
+            breaker.allow()
+            if attempt and hasattr(body, "seek"):
+                body.seek(0)  # streamed bodies are consumed by the previous attempt
+
+            try:
+                res = transport.request(method, url, **kwargs)
+            except requests.exceptions.RequestException as e:
+                breaker.record_failure()
+                if attempt == self.max_retries - 1:
+                    raise
+                wait = self.delay(attempt)
+                log(f"[Retry {attempt+1}] {method.upper()} {url} error: {type(e).__name__}: {e} (sleep {wait:.1f}s)")
+                time.sleep(wait)
+                continue
+            except BaseException:
+                breaker.release_probe()  # not a network failure, so no verdict on the host
+                raise
+
+            if res.status_code not in self.retry_statuses:
+                breaker.record_success()  # success, or a client error: the host itself is fine
+                return res
+
+            breaker.record_failure()
+            if attempt == self.max_retries - 1:
+                return res
+            wait = self.delay(attempt, res)
+            log(
+                f"[Retry {attempt+1}] {method.upper()} {url} failed | "
+                f"Status={res.status_code}, Reason={res.reason} (sleep {wait:.1f}s)"
+            )
+            res.close()
+            time.sleep(wait)
+
+
+_policy = None
+
+
+def get_retry_policy():
+    global _policy
+    if _policy is None:
+        _policy = RetryPolicy()
+    return _policy
@@ -0,0 +1,157 @@
+import html
+import threading
+import time
+from collections import OrderedDict
+
+import redis
+
+from clients.media_registry import site_id
+from config import Config
+from utils.helpers import log
+
+
+class TaxonomyCache:
+    """
+    name -> id cache for one WooCommerce taxonomy ("categories" or "tags").
+
+    Lookups go to an in-process LRU first, then to a Redis hash shared by all
+    workers, one per site (wc_taxonomy:<site>:<kind>). Both tiers are keyed by
+    the normalized term name (slugs are stored too, since the Telegram bot
+    sends category slugs).
+    """
+
+    WARM_RETRY_MIN = 30
+    WARM_RETRY_MAX = 1800
+
+    def __init__(self, kind, site=None, max_size=None, ttl=None, redis_client=None):
+        self.kind = kind
+        self.site = site or site_id()
+        self.key = f"wc_taxonomy:{self.site}:{kind}"
+        self.warm_key = f"{self.key}:warm"
+        self.max_size = max_size or Config.TAXONOMY_CACHE_SIZE
+        self.ttl = ttl or Config.TAXONOMY_CACHE_TTL
+        if redis_client is None and Config.REDIS_URL:
+            redis_client = redis.Redis.from_url(Config.REDIS_URL)
+        self.redis = redis_client
+
+        self.local = OrderedDict()
+        self.lock = threading.Lock()
+        self.warm_lock = threading.Lock()
+        self.warmed = False
+        self.warm_retry_at = 0
+        self.warm_retry_delay = self.WARM_RETRY_MIN
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(name):
+        return html.unescape(str(name)).strip().lower()
+
+    def _remember(self, name, term_id):
+        with self.lock:
+            self.local[name] = term_id
+            self.local.move_to_end(name)
+            while len(self.local) > self.max_size:
+                self.local.popitem(last=False)
+
+    def get(self, name):
+        name = self.normalize(name)
+        with self.lock:
+            if name in self.local:
+                self.local.move_to_end(name)
+                self.hits += 1
+                return self.local[name]
+
+        if self.redis is not None:
+            try:
+                value = self.redis.hget(self.key, name)
+            except redis.exceptions.RedisError as e:
+                log(f"[TaxonomyCache:{self.kind}] Redis get error: {e}")
+                value = None
+            if value is not None:
+                term_id = int(value)
+                self._remember(name, term_id)
+                with self.lock:
+                    self.redis_hits += 1
+                return term_id
+
+        with self.lock:
+            self.misses += 1
+        return None
+
+    def set_many(self, mapping):
+        mapping = {self.normalize(k): int(v) for k, v in mapping.items() if k}
+        if not mapping:
+            return
+        for name, term_id in mapping.items():
+            self._remember(name, term_id)
+        if self.redis is not None:
+            try:
+                pipe = self.redis.pipeline(transaction=False)
+                pipe.hset(self.key, mapping=mapping)
+                pipe.expire(self.key, self.ttl)
+                pipe.execute()
+            except redis.exceptions.RedisError as e:
+                log(f"[TaxonomyCache:{self.kind}] Redis set error: {e}")
+
+    def set(self, name, term_id):
+        self.set_many({name: term_id})
+
+    def invalidate(self, name):
+        name = self.normalize(name)
+        with self.lock:
+            self.local.pop(name, None)
+        if self.redis is not None:
+            try:
+                self.redis.hdel(self.key, name)
+            except redis.exceptions.RedisError as e:
+                log(f"[TaxonomyCache:{self.kind}] Redis invalidate error: {e}")
+
+    def is_warm(self):
+        """True once this process, or any worker sharing Redis, ran a full prefetch"""
+        if self.warmed:
+            return True
+        if self.redis is not None:
+            try:
+                self.warmed = bool(self.redis.exists(self.warm_key))
+            except redis.exceptions.RedisError:
+                pass
+        return self.warmed
+
+    def warm_due(self):
+        """False while a failed prefetch is backing off"""
+        return time.monotonic() >= self.warm_retry_at
+
+    def warm_failed(self):
+        """Back off before the next prefetch attempt; returns the delay"""
+        delay = self.warm_retry_delay
+        self.warm_retry_at = time.monotonic() + delay
+        self.warm_retry_delay = min(delay * 2, self.WARM_RETRY_MAX)
+        return delay
+
+    def mark_warm(self):
+        self.warmed = True
+        self.warm_retry_delay = self.WARM_RETRY_MIN
+        if self.redis is not None:
+            try:
+                self.redis.set(self.warm_key, 1, ex=self.ttl)
+            except redis.exceptions.RedisError as e:
+                log(f"[TaxonomyCache:{self.kind}] Redis warm marker error: {e}")
+
+    def stats(self):
+        total = self.hits + self.redis_hits + self.misses
+        return {
+            "hits": self.hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.redis_hits) / total, 3) if total else 0.0,
+            "size": len(self.local),
+        }
+
+    def log_stats(self):
+        s = self.stats()
+        log(
+            f"[TaxonomyCache:{self.kind}] hits={s['hits']} redis_hits={s['redis_hits']} "
+            f"misses={s['misses']} hit_rate={s['hit_rate']} size={s['size']}"
+        )
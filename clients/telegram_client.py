@@ -1,13 +1,60 @@
+import asyncio
 import logging
-from telegram.ext import Application
+from telegram.ext import Application, BaseUpdateProcessor
 from config import Config
 
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    Handles updates of different users concurrently and the updates of one
+    user one after another, in the order they arrived, so a handler waiting
+    on one user's uploads does not hold up everyone else.
+    """
+
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        self.users = {}  # user id -> [lock, updates waiting or running]
+
+    async def do_process_update(self, update, coroutine):
+        user = getattr(update, "effective_user", None)
+        if user is None:
+            await coroutine
+            return
+        entry = self.users.setdefault(user.id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                await coroutine
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self.users[user.id]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+
 class TelegramClient:
-    def __init__(self):
+    def __init__(self, post_init=None):
         token = Config.TELEGRAM_BOT_TOKEN
         if not token:
             raise ValueError("TELEGRAM_BOT_TOKEN is missing in config!")
-        self.app = Application.builder().token(token).build()
+        builder = Application.builder().token(token).concurrent_updates(PerUserUpdateProcessor(Config.TELEGRAM_CONCURRENT_UPDATES))
+        if post_init:
+            builder = builder.post_init(post_init)  # runs inside the bot's event loop before updates arrive
+        self.app = builder.build()
 
     def add_handler(self, handler):
         self.app.add_handler(handler)
+
+    def run(self):
+        """Serve updates in TELEGRAM_MODE: long polling (default) or the embedded webhook receiver"""
+        if Config.TELEGRAM_MODE == "webhook":
+            from clients.telegram_webhook import run_webhook
+            asyncio.run(run_webhook(self.app, Config.TELEGRAM_WEBHOOK_URL))
+        else:
+            # poll_interval=0: the next long poll starts as soon as the previous one returns
+            self.app.run_polling(poll_interval=0, timeout=30, drop_pending_updates=True)
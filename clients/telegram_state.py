@@ -0,0 +1,141 @@
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
+
+import redis
+import redis.asyncio as aioredis
+
+from config import Config
+from utils.helpers import log
+
+FIELDS = ("step", "substep", "chain", "data")
+
+# Record a finished upload only if collect_images/clear_images has not dropped
+# the list meanwhile, so a late upload neither leaks into the next product nor
+# recreates the hash without a TTL
+_IMAGE_FINISHED = """
+if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 1 then
+    redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+    return 1
+end
+return 0
+"""
+
+
+class ConversationBusy(Exception):
+    """Another update of the same user is still being handled"""
+
+
+class ConversationStore:
+    """
+    Per-user conversation state of the Telegram bot, kept in Redis so any bot
+    replica can continue a conversation another one started, and a restart
+    does not lose half-entered products.
+
+    tg_state:<user_id> is a small hash (step, substep, chain, data as JSON)
+    that expires after Config.TELEGRAM_STATE_TTL seconds of inactivity.
+    Updates of one user are handled under tg_state:<user_id>:lock, so two
+    replicas never interleave their read-modify-write of the same state; an
+    update that can't get the lock within Config.TELEGRAM_STATE_LOCK_WAIT
+    seconds raises ConversationBusy instead of holding up the handler.
+    Product images, which may be uploaded by different replicas, are tracked
+    in tg_state:<user_id>:images (message id -> URL, empty while uploading).
+    """
+
+    def __init__(self, redis_client=None, ttl=None, lock_timeout=None, lock_wait=None):
+        self.redis = redis_client or aioredis.Redis.from_url(Config.REDIS_URL, decode_responses=True)
+        self.ttl = ttl or Config.TELEGRAM_STATE_TTL
+        self.lock_timeout = lock_timeout or Config.TELEGRAM_STATE_LOCK_TIMEOUT
+        self.lock_wait = lock_wait or Config.TELEGRAM_STATE_LOCK_WAIT
+        self._image_finished = self.redis.register_script(_IMAGE_FINISHED)
+
+    @staticmethod
+    def key(user_id):
+        return f"tg_state:{user_id}"
+
+    async def load(self, user_id):
+        raw = await self.redis.hgetall(self.key(user_id))
+        if not raw.get("step"):
+            return {}
+        state = {"step": raw["step"], "substep": int(raw.get("substep") or 0), "data": json.loads(raw.get("data") or "{}")}
+        if raw.get("chain"):
+            state["chain"] = raw["chain"]
+        return state
+
+    async def save(self, user_id, state):
+        key = self.key(user_id)
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.delete(key)
+        if state.get("step"):
+            pipe.hset(key, mapping={
+                "step": state["step"],
+                "substep": state.get("substep", 0),
+                "chain": state.get("chain", ""),
+                "data": json.dumps(state.get("data", {}), ensure_ascii=False, separators=(",", ":")),
+            })
+            pipe.expire(key, self.ttl)
+        await pipe.execute()
+
+    @asynccontextmanager
+    async def session(self, user_id, user_data):
+        """
+        Load the user's state into `user_data` under the user's lock and write
+        it back, if it changed, when the block exits.
+        """
+        lock = self.redis.lock(f"{self.key(user_id)}:lock", timeout=self.lock_timeout,
+                               blocking_timeout=self.lock_wait, thread_local=False)
+        if not await lock.acquire():
+            raise ConversationBusy(user_id)
+        try:
+            state = await self.load(user_id)
+            user_data.clear()
+            user_data.update(state)
+            yield user_data
+            current = {k: user_data[k] for k in FIELDS if k in user_data}
+            if current != state:
+                await self.save(user_id, current)
+        finally:
+            try:
+                await lock.release()
+            except redis.exceptions.LockError:
+                log(f"[ConversationStore] Lock of user {user_id} expired before the update finished")
+
+    # -------- product images --------
+    def images_key(self, user_id):
+        return f"{self.key(user_id)}:images"
+
+    async def image_started(self, user_id, message_id):
+        key = self.images_key(user_id)
+        await self.redis.pipeline().hset(key, message_id, "").expire(key, self.ttl).execute()
+
+    async def image_finished(self, user_id, message_id, url=None):
+        if url:
+            if not await self._image_finished(keys=[self.images_key(user_id)], args=[message_id, url, self.ttl]):
+                log(f"[ConversationStore] Dropped late upload {message_id} of user {user_id}")
+        else:
+            await self.redis.hdel(self.images_key(user_id), message_id)
+
+    async def pending_images(self, user_id):
+        return sum(1 for url in (await self.redis.hvals(self.images_key(user_id))) if not url)
+
+    async def collect_images(self, user_id, timeout=None):
+        """
+        Wait until the user's uploads on every replica are done (at most
+        `timeout` seconds, by default half the lock timeout since the caller
+        holds the user's lock), then return their URLs in message order and
+        reset the list. Uploads still running after the timeout are left out.
+        """
+        key = self.images_key(user_id)
+        deadline = time.monotonic() + (timeout or self.lock_timeout / 2)
+        while True:
+            images = await self.redis.hgetall(key)
+            if all(images.values()) or time.monotonic() > deadline:
+                break
+            await asyncio.sleep(0.5)
+        await self.redis.delete(key)
+        return [url for _, url in sorted(images.items(), key=lambda item: int(item[0])) if url]
+
+    async def clear_images(self, user_id):
+        await self.redis.delete(self.images_key(user_id))
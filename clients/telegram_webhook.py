@@ -0,0 +1,173 @@
+import argparse
+import asyncio
+import hmac
+import json
+import time
+
+import requests
+from telegram import Update
+
+from config import Config
+from utils.helpers import log
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+MAX_BODY = 1024 * 1024
+LOOPBACK = "127.0.0.1"
+
+REASONS = {200: "OK", 400: "Bad Request", 401: "Unauthorized", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large"}
+
+
+class WebhookReceiver:
+    """
+    Minimal asyncio HTTP server for Telegram webhook calls.
+
+    Accepts POST <path> with a JSON update, checks the secret token header
+    Telegram sends when the webhook was registered with `secret_token`, and
+    puts the update on the application's queue right away. Without a secret
+    anyone could post updates, so the receiver then only listens on loopback
+    (for the local relay).
+    """
+
+    def __init__(self, application, path=None, secret=None, listen=None, port=None):
+        self.application = application
+        self.path = "/" + (path or Config.TELEGRAM_WEBHOOK_PATH).strip("/")
+        self.secret = secret if secret is not None else Config.TELEGRAM_WEBHOOK_SECRET
+        self.listen = listen or Config.TELEGRAM_WEBHOOK_LISTEN
+        self.port = port or Config.TELEGRAM_WEBHOOK_PORT
+        self.server = None
+        if not self.secret and self.listen != LOOPBACK:
+            log(f"[Webhook] TELEGRAM_WEBHOOK_SECRET is not set; listening on {LOOPBACK} instead of {self.listen}")
+            self.listen = LOOPBACK
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, self.listen, self.port)
+        log(f"[Webhook] Listening on http://{self.listen}:{self.port}{self.path}")
+
+    async def stop(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def _respond(self, writer, status):
+        writer.write(f"HTTP/1.1 {status} {REASONS[status]}\r\nContent-Length: 0\r\nConnection: close\r\n\r\n".encode())
+        await writer.drain()
+
+    async def _handle(self, reader, writer):
+        try:
+            status = await self._process(reader)
+            await self._respond(writer, status)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _process(self, reader):
+        request_line = (await reader.readline()).decode("latin-1").split()
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if len(request_line) < 2:
+            return 400
+        method, target = request_line[0], request_line[1].split("?")[0]
+        if target != self.path:
+            return 404
+        if method != "POST":
+            return 405
+        if self.secret and not hmac.compare_digest(headers.get(SECRET_HEADER.lower(), ""), self.secret):
+            return 401
+        try:
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            return 400
+        if length < 0:
+            return 400
+        if length > MAX_BODY:
+            return 413
+
+        body = await reader.readexactly(length)
+        try:
+            update = Update.de_json(json.loads(body), self.application.bot)
+        except ValueError:
+            return 400
+        await self.application.update_queue.put(update)
+        return 200
+
+
+async def run_webhook(application, webhook_url=None, drop_pending_updates=True):
+    """
+    Run the bot on a WebhookReceiver until SIGINT/SIGTERM. With `webhook_url`
+    (the public base URL), the webhook is registered with Telegram; without it,
+    updates are expected from a local relay (see __main__).
+    """
+    import signal
+
+    receiver = WebhookReceiver(application)
+    if webhook_url and not receiver.secret:
+        raise ValueError("TELEGRAM_WEBHOOK_SECRET is required to register a public webhook!")
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    async with application:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        await receiver.start()
+        if webhook_url:
+            await application.bot.set_webhook(
+                url=webhook_url.rstrip("/") + receiver.path,
+                secret_token=receiver.secret,
+                allowed_updates=Update.ALL_TYPES,
+                drop_pending_updates=drop_pending_updates,
+            )
+            log(f"[Webhook] Registered {webhook_url.rstrip('/')}{receiver.path} with Telegram")
+        await stop.wait()
+        await receiver.stop()
+        await application.stop()
+
+
+def relay(target, secret=None, updates_file=None):
+    """
+    Local stand-in for Telegram's update pusher: forwards updates to the
+    receiver at `target` with the secret header. Replays an NDJSON file of
+    updates, or long-polls getUpdates (which removes any registered webhook).
+    """
+    headers = {SECRET_HEADER: secret} if secret else {}
+
+    def push(update):
+        res = requests.post(target, json=update, headers=headers, timeout=10)
+        log(f"[Relay] update {update.get('update_id')} -> {res.status_code}")
+
+    if updates_file:
+        with open(updates_file, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    push(json.loads(line))
+        return
+
+    api = f"https://api.telegram.org/bot{Config.TELEGRAM_BOT_TOKEN}"
+    requests.post(f"{api}/deleteWebhook", timeout=10)
+    offset = None
+    while True:
+        try:
+            res = requests.get(f"{api}/getUpdates", params={"timeout": 30, "offset": offset}, timeout=40)
+            for update in res.json().get("result", []):
+                push(update)
+                offset = update["update_id"] + 1
+        except requests.exceptions.RequestException as e:
+            log(f"[Relay] {e}")
+            time.sleep(2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Forward Telegram updates to a local webhook receiver")
+    parser.add_argument("--target", default=f"http://127.0.0.1:{Config.TELEGRAM_WEBHOOK_PORT}/{Config.TELEGRAM_WEBHOOK_PATH.strip('/')}")
+    parser.add_argument("--file", help="NDJSON file of updates to replay instead of polling Telegram")
+    args = parser.parse_args()
+    relay(args.target, Config.TELEGRAM_WEBHOOK_SECRET, args.file)
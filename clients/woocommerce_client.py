@@ -1,44 +1,46 @@
-import requests, time, os
-from requests.auth import HTTPBasicAuth
 from config import Config
+from clients.http_transport import get_transport
+from clients.media_registry import MediaRegistry
+from clients.multipart import MultipartFile
+from clients.retry_policy import CircuitOpenError, get_retry_policy
+from clients.taxonomy_cache import TaxonomyCache
 from utils.helpers import log
+from utils.image_optimizer import prepare_bytes, prepare_file
+
+# WooCommerce accepts at most 100 objects per batch request
+WC_BATCH_LIMIT = 100
 
 
 class WooCommerceClient:
     def __init__(self):
         self.base_url = f"{Config.WORDPRESS_URL}/wp-json/wc/v3"
         self.media_url = f"{Config.WORDPRESS_URL}/wp-json/wp/v2/media"
-        self.auth = HTTPBasicAuth(Config.WC_CONSUMER_KEY, Config.WC_CONSUMER_SECRET)
+        self.auth = (Config.WC_CONSUMER_KEY, Config.WC_CONSUMER_SECRET)
         self.headers = {"User-Agent": "Mozilla/5.0"}
+        self.http = get_transport()
+        self.retry = get_retry_policy()
+        self.media_registry = MediaRegistry()
+        self.term_caches = {"categories": TaxonomyCache("categories"), "tags": TaxonomyCache("tags")}
 
     def _request(self, method, endpoint, **kwargs):
         """Unified request handler with retry & logging"""
         url = f"{self.base_url}{endpoint}"
-        for attempt in range(Config.MAX_RETRIES):
-            try:
-                res = requests.request(
-                    method,
-                    url,
-                    auth=self.auth,
-                    headers=self.headers,
-                    timeout=Config.TIMEOUT,
-                    **kwargs
-                )
-
-                if res.status_code in (200, 201):
-                    return res.json()
-
-                log(
-                    f"[Retry {attempt+1}] {method.upper()} {url} failed | "
-                    f"Status={res.status_code}, Reason={res.reason}, Response={res.text}"
-                )
-
-            except requests.exceptions.RequestException as e:
-                log(f"[Retry {attempt+1}] Request error on {method.upper()} {url}: {e}")
-
-            time.sleep(2)
-
-        raise Exception(f"Failed after {Config.MAX_RETRIES} retries: {method.upper()} {url}")
+        res = self.retry.send(
+            self.http,
+            method,
+            url,
+            auth=self.auth,
+            headers=self.headers,
+            timeout=Config.TIMEOUT,
+            **kwargs
+        )
+        if res.ok:
+            return res.json()
+
+        raise Exception(
+            f"{method.upper()} {url} failed | "
+            f"Status={res.status_code}, Reason={res.reason}, Response={res.text}"
+        )
 
     # ---- Product Methods ----
     def create_product(self, data: dict):
@@ -47,47 +49,206 @@ class WooCommerceClient:
     def update_product(self, product_id, data: dict):
         return self._request("put", f"/products/{product_id}", json=data)
 
-    # ---- Category Methods ----
-    def get_or_create_category(self, name):
-        res = self._request("get", "/products/categories", params={"search": name})
-        if res:
-            return res[0]["id"]
+    def batch_products(self, create=None, update=None, delete=None):
+        """POST /products/batch; results come back in the same order as the input lists"""
+        payload = {}
+        if create:
+            payload["create"] = create
+        if update:
+            payload["update"] = update
+        if delete:
+            payload["delete"] = delete
+        return self._request("post", "/products/batch", json=payload)
+
+    def _paginate(self, endpoint, params=None, per_page=100):
+        """Fetch every page of a collection endpoint"""
+        items = []
+        page = 1
+        while True:
+            res = self._request("get", endpoint, params={**(params or {}), "per_page": per_page, "page": page})
+            if not res:
+                break
+            items.extend(res)
+            if len(res) < per_page:
+                break
+            page += 1
+        return items
+
+    # ---- Taxonomy (categories / tags) ----
+    def prefetch_terms(self, kind):
+        """Warm the name->id cache of a taxonomy with one paginated listing of all its terms"""
+        terms = self._paginate(f"/products/{kind}", {"hide_empty": "false"})
+        mapping = {}
+        for term in terms:
+            mapping[term["name"]] = term["id"]
+            mapping[term["slug"]] = term["id"]
+        cache = self.term_caches[kind]
+        cache.set_many(mapping)
+        cache.mark_warm()
+        log(f"Prefetched {len(terms)} product {kind}")
+        return mapping
+
+    def _ensure_warm(self, kind):
+        cache = self.term_caches[kind]
+        if cache.is_warm():
+            return
+        with cache.warm_lock:
+            if cache.is_warm() or not cache.warm_due():
+                return
+            try:
+                self.prefetch_terms(kind)
+            except Exception as e:
+                # don't retry the full listing on every lookup
+                log(f"⚠️ Prefetch of product {kind} failed: {e}; retrying in {cache.warm_failed()}s")
+
+    @staticmethod
+    def _match_term(results, name):
+        """
+        (id, exact) of the search result for `name`: an exact name/slug match,
+        else the first result, which is used but never cached; (None, False) for none.
+        """
+        if not results:
+            return None, False
+        wanted = TaxonomyCache.normalize(name)
+        for term in results:
+            if wanted in (TaxonomyCache.normalize(term["name"]), TaxonomyCache.normalize(term["slug"])):
+                return term["id"], True
+        return results[0]["id"], False
+
+    def _get_or_create_term(self, kind, name):
+        cache = self.term_caches[kind]
+        term_id = cache.get(name)
+        if term_id is not None:
+            return term_id
+
+        self._ensure_warm(kind)
+        term_id = cache.get(name)
+        if term_id is not None:
+            return term_id
+
+        endpoint = f"/products/{kind}"
+        term_id, exact = self._match_term(self._request("get", endpoint, params={"search": name}), name)
+        if term_id is None:
+            try:
+                term_id, exact = self._request("post", endpoint, json={"name": name})["id"], True
+            except Exception:
+                # Lost a race with another worker creating the same term: drop our entry and look it up again
+                cache.invalidate(name)
+                term_id, exact = self._match_term(self._request("get", endpoint, params={"search": name}), name)
+                if term_id is None:
+                    raise
+
+        if exact:
+            cache.set(name, term_id)
+        return term_id
+
+    def resolve_terms(self, kind, names):
+        """
+        Resolve many category/tag names to ids at once.
+        A cold cache is warmed once with a paginated listing of the taxonomy; after
+        that a miss means a new term, created through /products/<kind>/batch (terms
+        that exist after all come back as term_exists with their id). Returns {name: id}.
+        """
+        cache = self.term_caches[kind]
+        names = [n.strip() for n in names or [] if n and n.strip()]
+        wanted = {}
+        for name in names:
+            wanted.setdefault(TaxonomyCache.normalize(name), name)
+
+        resolved = {}
+        to_create = []
+        for key, name in wanted.items():
+            term_id = cache.get(name)
+            if term_id is None:
+                to_create.append(key)
+            else:
+                resolved[key] = term_id
+
+        if to_create:
+            self._ensure_warm(kind)
+            missing, to_create = to_create, []
+            for key in missing:
+                term_id = cache.get(wanted[key])
+                if term_id is None:
+                    to_create.append(key)
+                else:
+                    resolved[key] = term_id
+
+            for i in range(0, len(to_create), WC_BATCH_LIMIT):
+                chunk = to_create[i:i + WC_BATCH_LIMIT]
+                res = self._request("post", f"/products/{kind}/batch", json={"create": [{"name": wanted[k]} for k in chunk]})
+                created = {}
+                for key, item in zip(chunk, res.get("create", [])):
+                    error = item.get("error")
+                    if error:
+                        # term_exists: created by someone else after our listing, WooCommerce tells us its id
+                        term_id = (error.get("data") or {}).get("resource_id")
+                        if not term_id:
+                            log(f"⚠️ Could not create {kind[:-1]} '{wanted[key]}': {error.get('message')}")
+                            continue
+                    else:
+                        term_id = item["id"]
+                    created[key] = term_id
+                cache.set_many(created)
+                resolved.update(created)
+
+        return {name: resolved[TaxonomyCache.normalize(name)] for name in names if TaxonomyCache.normalize(name) in resolved}
 
-        res = self._request("post", "/products/categories", json={"name": name})
-        return res["id"]
+    def get_or_create_category(self, name):
+        return self._get_or_create_term("categories", name)
 
-    # ---- Tag Methods ----
     def get_or_create_tag(self, name):
-        res = self._request("get", "/products/tags", params={"search": name})
-        if res:
-            return res[0]["id"]
+        return self._get_or_create_term("tags", name)
 
-        res = self._request("post", "/products/tags", json={"name": name})
-        return res["id"]
+    def log_cache_stats(self):
+        for cache in self.term_caches.values():
+            cache.log_stats()
 
     # ---- Media Upload ----
-    def upload_product_media(self, product_id, image_bytes, filename="image.jpg"):
-        headers = {**self.headers, "Content-Disposition": f'attachment; filename="{filename}"'}
-        files = {"file": (filename, image_bytes, "image/jpeg")}
-        data = {"post": product_id}
-
-        for attempt in range(Config.MAX_RETRIES):
-            try:
-                res = requests.post(
-                    self.media_url,
-                    auth=self.auth,
-                    headers=headers,
-                    files=files,
-                    data=data,
-                    timeout=Config.TIMEOUT,
-                )
-                if res.status_code == 201:
-                    return res.json()["id"]
-
-                log(f"[Retry {attempt+1}] Media upload error: {res.status_code} | {res.text}")
-            except requests.exceptions.RequestException as e:
-                log(f"[Retry {attempt+1}] Media upload request error: {e}")
-            time.sleep(2)
+    def get_media(self, media_id):
+        """The media item's JSON, or None when it no longer exists"""
+        res = self.retry.send(
+            self.http, "get", f"{self.media_url}/{media_id}", auth=self.auth, headers=self.headers,
+            params={"_fields": "id,source_url"}, timeout=Config.TIMEOUT,
+        )
+        if res.status_code in (404, 410):
+            return None
+        res.raise_for_status()
+        return res.json()
+
+    def _upload_media(self, **kwargs):
+        try:
+            res = self.retry.send(self.http, "post", self.media_url, auth=self.auth, timeout=Config.TIMEOUT, **kwargs)
+            if res.status_code == 201:
+                return res.json()
+            log(f"Media upload error: {res.status_code} | {res.text}")
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            log(f"Media upload request error: {e}")
 
         log("❌ Failed to upload media after retries.")
         return None
+
+    def upload_product_media(self, product_id, image_bytes, filename="image.jpg"):
+        data = {"post": product_id} if product_id else {}
+
+        def upload():
+            content, name, mime = prepare_bytes(image_bytes, filename)
+            headers = {**self.headers, "Content-Disposition": f'attachment; filename="{name}"'}
+            return self._upload_media(headers=headers, files={"file": (name, content, mime)}, data=data)
+
+        media = self.media_registry.upload_once(MediaRegistry.hash_bytes(image_bytes), upload, self.get_media)
+        return media["id"] if media else None
+
+    def upload_product_media_file(self, product_id, path, filename=None):
+        """Upload a local file as a streamed multipart body, read from disk chunk by chunk"""
+        fields = {"post": product_id} if product_id else None
+
+        def upload():
+            with prepare_file(path, filename) as (upload_path, name, mime):
+                with MultipartFile(upload_path, filename=name, content_type=mime, fields=fields) as body:
+                    return self._upload_media(headers={**self.headers, **body.headers}, data=body)
+
+        media = self.media_registry.upload_once(MediaRegistry.hash_file(path), upload, self.get_media)
+        return media["id"] if media else None
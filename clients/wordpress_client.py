@@ -1,41 +1,92 @@
-import requests, time
 from config import Config
+from clients.http_transport import get_transport
+from clients.media_registry import MediaRegistry
+from clients.multipart import MultipartFile
+from clients.retry_policy import get_retry_policy
 from utils.helpers import log
+from utils.image_optimizer import prepare_bytes, prepare_file
 
 class WordPressClient:
     def __init__(self):
         self.auth = (Config.WORDPRESS_USER, Config.WORDPRESS_PASSWORD)
+        self.http = get_transport()
+        self.retry = get_retry_policy()
+        self.media_url = f"{Config.WORDPRESS_URL}/wp-json/wp/v2/media"
+        self.media_registry = MediaRegistry()
 
     def create_post(self, title, content, status="draft"):
         headers = {"User-Agent": "Mozilla/5.0"}
         post_data = {"title": title, "content": content, "status": status}
-        for attempt in range(Config.MAX_RETRIES):
-            try:
-                res = requests.post(
-                    f"{Config.WORDPRESS_URL}/wp-json/wp/v2/posts",
-                    auth=self.auth,
-                    headers=headers,
-                    json=post_data,
-                    timeout=Config.TIMEOUT
-                )
-                if res.status_code == 201:
-                    return res.json()["id"]
-                else:
-                    log(f"[Retry {attempt+1}] WP post error: status={res.status_code}, body={res.text}")
-            except requests.exceptions.RequestException as e:
-                log(f"[Retry {attempt+1}] WP request error: {type(e).__name__}: {e}")
-            time.sleep(2)
+        res = self.retry.send(
+            self.http,
+            "post",
+            f"{Config.WORDPRESS_URL}/wp-json/wp/v2/posts",
+            auth=self.auth,
+            headers=headers,
+            json=post_data,
+            timeout=Config.TIMEOUT
+        )
+        if res.status_code == 201:
+            return res.json()["id"]
+        log(f"WP post error: status={res.status_code}, body={res.text}")
         raise Exception("Failed to create post.")
 
 
 
-    def upload_media(self, post_id, image_bytes, filename="featured.jpg"):
-        files = {"file": (filename, image_bytes, "image/jpeg")}
-        res = requests.post(f"{Config.WORDPRESS_URL}/wp-json/wp/v2/media", auth=self.auth, files=files, timeout=Config.TIMEOUT)
+    def get_media(self, media_id):
+        """The media item's JSON, or None when it no longer exists"""
+        res = self.retry.send(self.http, "get", f"{self.media_url}/{media_id}", auth=self.auth, params={"_fields": "id,source_url"}, timeout=Config.TIMEOUT)
+        if res.status_code in (404, 410):
+            return None
+        res.raise_for_status()
+        return res.json()
+
+    def iter_media(self, per_page=100):
+        page = 1
+        while True:
+            res = self.retry.send(self.http, "get", self.media_url, auth=self.auth, params={"per_page": per_page, "page": page}, timeout=Config.TIMEOUT)
+            if res.status_code == 400:
+                return  # past the last page
+            res.raise_for_status()
+            items = res.json()
+            yield from items
+            if len(items) < per_page:
+                return
+            page += 1
+
+    def _upload(self, **kwargs):
+        res = self.retry.send(self.http, "post", self.media_url, auth=self.auth, timeout=Config.TIMEOUT, **kwargs)
         if res.status_code == 201:
-            media_id = res.json()["id"]
-            requests.post(f"{Config.WORDPRESS_URL}/wp-json/wp/v2/posts/{post_id}", auth=self.auth, json={"featured_media": media_id}, timeout=Config.TIMEOUT)
-            return media_id
-        else:
-            log(f"WP image upload error: {res.text}")
+            return res.json()
+        log(f"WP image upload error: {res.text}")
+        return None
+
+    def upload_media_bytes(self, image_bytes, filename="image.jpg"):
+        """
+        Upload an in-memory image to the media library unless the same content
+        is already there. Returns {"id", "source_url", "reused"} or None.
+        """
+        def upload():
+            content, name, mime = prepare_bytes(image_bytes, filename)
+            return self._upload(files={"file": (name, content, mime)})
+
+        return self.media_registry.upload_once(MediaRegistry.hash_bytes(image_bytes), upload, self.get_media)
+
+    def upload_media(self, post_id, image_bytes, filename="featured.jpg"):
+        media = self.upload_media_bytes(image_bytes, filename)
+        if not media:
             return None
+        self.retry.send(self.http, "post", f"{Config.WORDPRESS_URL}/wp-json/wp/v2/posts/{post_id}", auth=self.auth, json={"featured_media": media["id"]}, timeout=Config.TIMEOUT)
+        return media["id"]
+
+    def upload_media_file(self, path, filename=None):
+        """
+        Upload a local image to the media library, streamed from disk, unless the
+        same content is already there. Returns {"id", "source_url", "reused"} or None.
+        """
+        def upload():
+            with prepare_file(path, filename) as (upload_path, name, mime):
+                with MultipartFile(upload_path, filename=name, content_type=mime) as body:
+                    return self._upload(headers={"User-Agent": "Mozilla/5.0", **body.headers}, data=body)
+
+        return self.media_registry.upload_once(MediaRegistry.hash_file(path), upload, self.get_media)
@@ -17,3 +17,84 @@ class Config:
     REDIS_URL = os.getenv("REDIS_URL")
     MAX_RETRIES = int(os.getenv("MAX_RETRIES", 3))
     TIMEOUT = int(os.getenv("TIMEOUT", 30))
+
+    # Workers
+    WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", 4))
+    WORKER_PREFETCH = int(os.getenv("WORKER_PREFETCH", 4))
+    ACK_FLUSH_INTERVAL = float(os.getenv("ACK_FLUSH_INTERVAL", 0.2))
+    RECLAIM_INTERVAL = int(os.getenv("RECLAIM_INTERVAL", 60))
+    RECLAIM_MIN_IDLE = int(os.getenv("RECLAIM_MIN_IDLE", 900))  # must exceed the longest job
+    ARTICLE_CHECKPOINT_TTL = int(os.getenv("ARTICLE_CHECKPOINT_TTL", 7 * 86400))
+    STEP_ENGINE_WORKERS = int(os.getenv("STEP_ENGINE_WORKERS", 8))
+    ARTICLE_IMAGES = os.getenv("ARTICLE_IMAGES", "false").lower() in ("1", "true", "yes")
+    PRODUCT_BATCH_SIZE = int(os.getenv("PRODUCT_BATCH_SIZE", 0))  # > 1 enables /products/batch mode
+    PRODUCT_BATCH_WAIT = float(os.getenv("PRODUCT_BATCH_WAIT", 5))
+
+    # Media uploads; image optimization needs Pillow
+    IMAGE_OPTIMIZE = os.getenv("IMAGE_OPTIMIZE", "false").lower() in ("1", "true", "yes")
+    IMAGE_MAX_SIZE = int(os.getenv("IMAGE_MAX_SIZE", 1600))  # longest side, in pixels
+    IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", 82))
+    IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "webp")  # webp, jpeg or keep
+    IMAGE_OPTIMIZE_WORKERS = int(os.getenv("IMAGE_OPTIMIZE_WORKERS", 2))
+    MEDIA_VERIFY_TTL = int(os.getenv("MEDIA_VERIFY_TTL", 3600))  # trust a registry hit this long before re-checking the media exists
+    MEDIA_UPLOAD_CONCURRENCY = int(os.getenv("MEDIA_UPLOAD_CONCURRENCY", 4))
+    TELEGRAM_UPLOAD_CONCURRENCY = int(os.getenv("TELEGRAM_UPLOAD_CONCURRENCY", 4))
+    TELEGRAM_CONCURRENT_UPDATES = int(os.getenv("TELEGRAM_CONCURRENT_UPDATES", 64))  # users served at once; one user's updates stay in order
+
+    # Telegram bot runtime: polling, or webhook served by clients/telegram_webhook.py
+    TELEGRAM_MODE = os.getenv("TELEGRAM_MODE", "polling").lower()
+    TELEGRAM_WEBHOOK_URL = os.getenv("TELEGRAM_WEBHOOK_URL")  # public base URL; unset when a local relay pushes updates
+    TELEGRAM_WEBHOOK_PATH = os.getenv("TELEGRAM_WEBHOOK_PATH", "telegram")
+    TELEGRAM_WEBHOOK_LISTEN = os.getenv("TELEGRAM_WEBHOOK_LISTEN", "0.0.0.0")
+    TELEGRAM_WEBHOOK_PORT = int(os.getenv("TELEGRAM_WEBHOOK_PORT", 8443))
+    TELEGRAM_WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET")
+    TELEGRAM_STATE_TTL = int(os.getenv("TELEGRAM_STATE_TTL", 86400))  # idle conversations are dropped after this
+    TELEGRAM_STATE_LOCK_TIMEOUT = int(os.getenv("TELEGRAM_STATE_LOCK_TIMEOUT", 60))
+    TELEGRAM_STATE_LOCK_WAIT = float(os.getenv("TELEGRAM_STATE_LOCK_WAIT", 2))  # then the update is answered with "busy"
+
+    # HTTP transport
+    HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", 10))
+    HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", 16))
+    HTTP2 = os.getenv("HTTP2", "false").lower() in ("1", "true", "yes")
+    RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", 1))
+    RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", 30))
+    CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 5))
+    CIRCUIT_RESET_TIMEOUT = int(os.getenv("CIRCUIT_RESET_TIMEOUT", 60))
+    STATS_INTERVAL = int(os.getenv("STATS_INTERVAL", 300))
+
+    # Caches
+    TAXONOMY_CACHE_SIZE = int(os.getenv("TAXONOMY_CACHE_SIZE", 2048))
+    TAXONOMY_CACHE_TTL = int(os.getenv("TAXONOMY_CACHE_TTL", 86400))
+    LLM_CACHE = os.getenv("LLM_CACHE", "false").lower() in ("1", "true", "yes")
+    LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", 256))
+    LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", 7 * 86400))
+    LLM_CACHE_REDIS_MAX = int(os.getenv("LLM_CACHE_REDIS_MAX", 10000))
+    # regexes (separated by ";;") stripped from every prompt before hashing
+    LLM_CACHE_VOLATILE_PATTERNS = [p for p in os.getenv("LLM_CACHE_VOLATILE_PATTERNS", "").split(";;") if p]
+
+    # LLM
+    LLM_STREAMING = os.getenv("LLM_STREAMING", "false").lower() in ("1", "true", "yes")
+    LLM_STREAM_STALL_TIMEOUT = int(os.getenv("LLM_STREAM_STALL_TIMEOUT", 20))
+    LLM_HEDGING = os.getenv("LLM_HEDGING", "false").lower() in ("1", "true", "yes")
+    LLM_FALLBACK_MODELS = [m.strip() for m in os.getenv("LLM_FALLBACK_MODELS", "").split(",") if m.strip()]
+    LLM_HEDGE_BUDGET = float(os.getenv("LLM_HEDGE_BUDGET", 0.05))  # at most this fraction of calls is hedged
+    LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", 20))
+    LLM_LATENCY_WINDOW = int(os.getenv("LLM_LATENCY_WINDOW", 200))
+    LLM_ROUTER_WORKERS = int(os.getenv("LLM_ROUTER_WORKERS", 32))
+    ARTICLE_OUTLINE = os.getenv("ARTICLE_OUTLINE", "false").lower() in ("1", "true", "yes")
+    ARTICLE_CHAPTER_CONCURRENCY = int(os.getenv("ARTICLE_CHAPTER_CONCURRENCY", 4))
+
+    # Dashboard
+    JOB_EVENTS_MAXLEN = int(os.getenv("JOB_EVENTS_MAXLEN", 10000))
+    SSE_HEARTBEAT = int(os.getenv("SSE_HEARTBEAT", 15))
+
+    # Bulk product ingestion
+    BULK_INGEST_CHUNK = int(os.getenv("BULK_INGEST_CHUNK", 500))
+
+    # Stream retention: acked entries older than MAX_AGE seconds or beyond the newest MAX_LEN
+    # are archived to STREAM_ARCHIVE_DIR and trimmed (0 disables a limit)
+    STREAM_RETENTION_MAX_AGE = int(os.getenv("STREAM_RETENTION_MAX_AGE", 7 * 86400))
+    STREAM_RETENTION_MAX_LEN = int(os.getenv("STREAM_RETENTION_MAX_LEN", 0))
+    STREAM_RETENTION_INTERVAL = int(os.getenv("STREAM_RETENTION_INTERVAL", 600))
+    STREAM_ARCHIVE_DIR = os.getenv("STREAM_ARCHIVE_DIR", "archive")
+    STREAM_ARCHIVE_SEGMENT = int(os.getenv("STREAM_ARCHIVE_SEGMENT", 10000))
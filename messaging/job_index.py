@@ -0,0 +1,173 @@
+import time
+
+import redis
+
+from config import Config
+from utils.helpers import log
+
+STATUSES = ("queued", "running", "done", "failed")
+
+EVENTS_STREAM = "jobs:events"
+
+# Every key a script touches is passed in KEYS; the status sets follow the fixed
+# ones, one per entry of STATUSES, and are looked up by their ":status:<name>" suffix.
+_STATUS_KEY = """
+local function status_key(status)
+    local suffix = ':status:' .. status
+    for i = 5, #KEYS do
+        if string.sub(KEYS[i], -#suffix) == suffix then
+            return KEYS[i]
+        end
+    end
+    error('unknown job status ' .. status)
+end
+"""
+
+# Move a job between status sets, keep the counters in step and publish the
+# transition on the events stream, atomically. A job's first status is
+# "queued", so a "queued" arriving for a job that already has a status was sent
+# after the worker picked the job up (the publisher indexes after its XADD):
+# it only fills in summary fields that are still missing.
+# KEYS[1] job hash, KEYS[2] counts hash, KEYS[3] all-jobs set, KEYS[4] events stream,
+# KEYS[5..] status sets
+# ARGV[1] job id, ARGV[2] new status, ARGV[3] score, ARGV[4] job stream,
+# ARGV[5] events MAXLEN, ARGV[6..] field/value pairs
+_TRANSITION = _STATUS_KEY + """
+local old = redis.call('HGET', KEYS[1], 'status')
+if old and ARGV[2] == 'queued' then
+    for i = 6, #ARGV, 2 do
+        redis.call('HSETNX', KEYS[1], ARGV[i], ARGV[i + 1])
+    end
+    return old
+end
+if old ~= ARGV[2] then
+    if old then
+        redis.call('ZREM', status_key(old), ARGV[1])
+        redis.call('HINCRBY', KEYS[2], old, -1)
+    else
+        redis.call('ZADD', KEYS[3], ARGV[3], ARGV[1])
+        redis.call('HINCRBY', KEYS[2], 'total', 1)
+    end
+    redis.call('ZADD', status_key(ARGV[2]), ARGV[3], ARGV[1])
+    redis.call('HINCRBY', KEYS[2], ARGV[2], 1)
+end
+redis.call('HSET', KEYS[1], 'status', ARGV[2], unpack(ARGV, 6))
+if old ~= ARGV[2] then
+    redis.call('XADD', KEYS[4], 'MAXLEN', '~', ARGV[5], '*',
+        'stream', ARGV[4], 'id', ARGV[1], 'status', ARGV[2], unpack(ARGV, 6))
+end
+return old
+"""
+
+# KEYS as for _TRANSITION (KEYS[4] unused); ARGV[1] job id
+_REMOVE = _STATUS_KEY + """
+local old = redis.call('HGET', KEYS[1], 'status')
+if old then
+    redis.call('ZREM', status_key(old), ARGV[1])
+    redis.call('HINCRBY', KEYS[2], old, -1)
+    redis.call('HINCRBY', KEYS[2], 'total', -1)
+end
+redis.call('ZREM', KEYS[3], ARGV[1])
+redis.call('DEL', KEYS[1])
+return old
+"""
+
+
+def _id_str(job_id):
+    return job_id.decode() if isinstance(job_id, bytes) else str(job_id)
+
+
+class JobIndex:
+    """
+    Secondary indexes over a job stream, kept up to date by publishers and workers:
+
+        jobs:<stream>:status:<status>  sorted set of job ids per status
+        jobs:<stream>:all              sorted set of every indexed job
+        jobs:<stream>:job:<id>         compact status hash (status, title, updated, error, ...)
+        jobs:<stream>:counts           per-status counters, read in O(1)
+
+    Scores come from the stream id, so every set is ordered by submission time
+    and a score works as a pagination cursor. Every status change is also
+    appended to the jobs:events stream for live dashboards. Entries of jobs
+    trimmed from the stream are dropped by StreamRetention via remove_before().
+    """
+
+    def __init__(self, redis_client, stream):
+        self.redis = redis_client
+        self.stream = stream
+        self.prefix = f"jobs:{stream}"
+        self.counts_key = f"{self.prefix}:counts"
+        self.all_key = f"{self.prefix}:all"
+        self._transition = self.redis.register_script(_TRANSITION)
+        self._remove = self.redis.register_script(_REMOVE)
+
+    def job_key(self, job_id):
+        return f"{self.prefix}:job:{_id_str(job_id)}"
+
+    def status_key(self, status):
+        return f"{self.prefix}:status:{status}"
+
+    def _keys(self, job_id):
+        return [self.job_key(job_id), self.counts_key, self.all_key, EVENTS_STREAM, *map(self.status_key, STATUSES)]
+
+    @staticmethod
+    def score(job_id):
+        ms, _, seq = _id_str(job_id).partition("-")
+        return int(ms) * 1000 + min(int(seq or 0), 999)
+
+    def transition(self, job_id, status, client=None, **fields):
+        """Set a job's status (plus extra summary fields); `client` may be a pipeline"""
+        pairs = []
+        for k, v in {**fields, "updated": int(time.time())}.items():
+            if v is not None:
+                pairs.extend([k, str(v)[:300]])
+        args = [_id_str(job_id), status, self.score(job_id), self.stream, Config.JOB_EVENTS_MAXLEN, *pairs]
+        try:
+            return self._transition(keys=self._keys(job_id), args=args, client=client)
+        except redis.exceptions.RedisError as e:
+            log(f"[JobIndex] Failed to mark {_id_str(job_id)} as {status}: {e}")
+
+    def remove(self, job_id):
+        try:
+            self._remove(keys=self._keys(job_id), args=[_id_str(job_id)])
+        except redis.exceptions.RedisError as e:
+            log(f"[JobIndex] Failed to remove {_id_str(job_id)}: {e}")
+
+    def remove_before(self, job_id, batch=500):
+        """Drop every indexed job older than `job_id` (e.g. trimmed from the stream); returns how many"""
+        removed = 0
+        while True:
+            ids = self.redis.zrangebyscore(self.all_key, "-inf", f"({self.score(job_id)}", start=0, num=batch)
+            if not ids:
+                return removed
+            pipe = self.redis.pipeline(transaction=False)
+            for old_id in ids:
+                self._remove(keys=self._keys(old_id), args=[_id_str(old_id)], client=pipe)
+            pipe.execute()
+            removed += len(ids)
+
+    def list(self, status=None, cursor=None, limit=20):
+        """Newest first; returns (jobs, next_cursor). next_cursor is None on the last page"""
+        key = self.status_key(status) if status else self.all_key
+        upper = f"({cursor}" if cursor else "+inf"
+        entries = self.redis.zrevrangebyscore(key, upper, "-inf", start=0, num=limit, withscores=True)
+
+        pipe = self.redis.pipeline(transaction=False)
+        for job_id, _ in entries:
+            pipe.hgetall(self.job_key(job_id))
+        hashes = pipe.execute() if entries else []
+
+        jobs = []
+        for (job_id, _), fields in zip(entries, hashes):
+            job = {k.decode(): v.decode() for k, v in fields.items()}
+            job["id"] = job_id.decode()
+            jobs.append(job)
+        next_cursor = int(entries[-1][1]) if len(entries) == limit else None
+        return jobs, next_cursor
+
+    def counts(self):
+        raw = self.redis.hgetall(self.counts_key)
+        counts = {s: 0 for s in STATUSES}
+        counts["total"] = 0
+        counts.update({k.decode(): max(0, int(v)) for k, v in raw.items()})
+        return counts
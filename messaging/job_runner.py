@@ -0,0 +1,169 @@
+import heapq
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import Config
+from utils.helpers import log
+
+
+def consumer_name(prefix):
+    """Unique consumer identity per process, so several processes can share one group"""
+    return f"{prefix}_{socket.gethostname()}_{os.getpid()}"
+
+
+class RetryLater(Exception):
+    """Raised by a handler to run the same message again after `delay` seconds, without acking it"""
+
+    def __init__(self, delay, reason=""):
+        super().__init__(reason or f"retry in {delay:.0f}s")
+        self.delay = delay
+
+
+class JobRunner:
+    """
+    Consumes a Redis Stream and keeps up to `concurrency` jobs in flight, plus
+    up to `prefetch` more read ahead and queued for the pool, so a batch of
+    messages comes in with one read instead of one read per job.
+
+    `handler(msg_id, fields)` runs on a pool thread and is responsible for acking
+    its own message, so every job is acked as soon as it finishes.
+    `reporters` are zero-argument callables (e.g. stats loggers) run every
+    Config.STATS_INTERVAL seconds from the consume loop.
+    With `reclaim=True`, messages left pending by a crashed consumer for longer
+    than `min_idle` seconds (Config.RECLAIM_MIN_IDLE) are claimed at startup
+    and every Config.RECLAIM_INTERVAL seconds and handled like new ones, and
+    consumers of exited processes are removed from the group once they have
+    nothing pending. `held` returns the ids of acknowledged-later messages the
+    handler keeps outside the runner (e.g. a batch being filled), which are
+    kept claimed like deferred jobs.
+    A handler raising RetryLater frees its pool thread; the message stays
+    pending and is handed to the handler again once the delay has passed.
+    Deferred jobs keep counting against `capacity`, so while a dependency is
+    down the runner stops reading new jobs instead of piling them up. They are
+    re-claimed to this consumer when deferred and every Config.RECLAIM_INTERVAL
+    seconds, so no worker (this one included) reclaims them as stale meanwhile.
+    """
+
+    def __init__(self, broker, group, consumer_prefix, handler, concurrency=None, prefetch=None, block=5000, reporters=None,
+                 reclaim=False, min_idle=None, held=None):
+        self.broker = broker
+        self.group = group
+        self.consumer = consumer_name(consumer_prefix)
+        self.reader = broker.consumer(group, self.consumer, block=block)
+        self.handler = handler
+        self.concurrency = max(1, concurrency or Config.WORKER_CONCURRENCY)
+        self.capacity = self.concurrency + max(0, Config.WORKER_PREFETCH if prefetch is None else prefetch)
+        self.pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix=consumer_prefix)
+        self.in_flight = 0
+        self.cond = threading.Condition()
+        self.reporters = (reporters or []) + [self.reader.log_stats]
+        self._last_report = time.monotonic()
+        self.reclaim = reclaim
+        self.min_idle = min_idle or Config.RECLAIM_MIN_IDLE
+        self.held = held
+        self._last_reclaim = 0
+        self.active = set()
+        self.deferred = []
+
+    def _run_job(self, msg_id, fields):
+        deferred = False
+        try:
+            self.handler(msg_id, fields)
+        except RetryLater as e:
+            log(f"[{self.consumer}] Deferring job {msg_id}: {e}")
+            self.broker.touch(self.group, self.consumer, [msg_id])
+            with self.cond:
+                heapq.heappush(self.deferred, (time.monotonic() + e.delay, msg_id, fields))
+            deferred = True
+        except Exception as e:
+            log(f"[{self.consumer}] Unhandled error in job {msg_id}: {e}")
+        finally:
+            with self.cond:
+                self.in_flight -= 1
+                if not deferred:
+                    self.active.discard(msg_id)  # deferred jobs stay active until they finish
+                self.cond.notify()
+
+    def submit(self, msg_id, fields):
+        """Start a job unless it is already running, queued or deferred in this runner"""
+        with self.cond:
+            if msg_id in self.active:
+                return False
+            self.in_flight += 1
+            self.active.add(msg_id)
+        self.pool.submit(self._run_job, msg_id, fields)
+        return True
+
+    def submit_due(self):
+        """Resubmit deferred jobs whose delay has passed, as far as there are free slots"""
+        due = []
+        with self.cond:
+            while self.deferred and self.deferred[0][0] <= time.monotonic() and self.in_flight < self.capacity:
+                due.append(heapq.heappop(self.deferred))
+                self.in_flight += 1
+        for _, msg_id, fields in due:
+            self.pool.submit(self._run_job, msg_id, fields)
+
+    def touch_deferred(self):
+        """Reset the idle time of deferred and held jobs, so they are not reclaimed as stale while they wait"""
+        with self.cond:
+            ids = [msg_id for _, msg_id, _ in self.deferred]
+        if self.held is not None:
+            ids.extend(self.held())
+        if ids:
+            self.broker.touch(self.group, self.consumer, ids)
+
+    def reclaim_stale(self, force=False):
+        if not force and time.monotonic() - self._last_reclaim < Config.RECLAIM_INTERVAL:
+            return
+        self._last_reclaim = time.monotonic()
+        self.touch_deferred()
+        if not self.reclaim:
+            return
+        for name in self.broker.prune_consumers(self.group, self.min_idle * 1000, keep=self.consumer):
+            log(f"[{self.consumer}] Removed idle consumer {name} from {self.group}")
+        free = self.free_slots(timeout=0)
+        if free <= 0:
+            return
+        claimed = self.broker.claim_stale(self.group, self.consumer, self.min_idle * 1000, count=free)
+        for msg_id, fields in claimed:
+            if self.submit(msg_id, fields):
+                log(f"[{self.consumer}] Reclaimed stale job {msg_id}")
+
+    def free_slots(self, timeout=None):
+        """Wait until at least one slot (running, prefetched or deferred) is free and return how many are"""
+        with self.cond:
+            self.cond.wait_for(lambda: self.in_flight + len(self.deferred) < self.capacity, timeout=timeout)
+            return self.capacity - self.in_flight - len(self.deferred)
+
+    def next_due(self):
+        """Seconds until the earliest deferred job is due, or None"""
+        with self.cond:
+            return max(0.0, self.deferred[0][0] - time.monotonic()) if self.deferred else None
+
+    def report(self, force=False):
+        if not force and time.monotonic() - self._last_report < Config.STATS_INTERVAL:
+            return
+        self._last_report = time.monotonic()
+        for reporter in self.reporters:
+            try:
+                reporter()
+            except Exception as e:
+                log(f"[{self.consumer}] Reporter failed: {e}")
+
+    def run(self):
+        log(f"[{self.consumer}] Consuming '{self.broker.stream}' with concurrency={self.concurrency}, prefetch={self.capacity - self.concurrency}")
+        self._last_reclaim = time.monotonic()
+        self.reclaim_stale(force=True)
+        while True:
+            self.report()
+            self.submit_due()
+            self.reclaim_stale()
+            free = self.free_slots(timeout=self.next_due())
+            if free <= 0:
+                continue
+            for msg_id, fields in self.reader.read(count=free):
+                self.submit(msg_id, fields)
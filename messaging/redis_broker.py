@@ -1,39 +1,224 @@
+import threading
+import time
+
 import redis
 from config import Config
+from messaging.job_index import JobIndex
 from utils.helpers import log
 
+
+def decode_entries(entries):
+    """One shared pass turning raw stream entries into (str id, {str: str}); deleted entries are dropped"""
+    return [
+        (msg_id.decode(), {k.decode(): v.decode() for k, v in fields.items()})
+        for msg_id, fields in entries
+        if fields is not None
+    ]
+
+
+class StreamConsumer:
+    """
+    Reads one stream as one member of a consumer group.
+
+    The group is created once, messages are read in batches of up to `count`
+    and decoded in a single pass, and acks are buffered: they go out with the
+    next read in the same pipeline, or after at most `ack_interval` seconds
+    from a background flusher, as one XACK for all of them.
+    """
+
+    def __init__(self, broker, group, name, block=5000, ack_interval=None):
+        self.broker = broker
+        self.redis = broker.redis
+        self.stream = broker.stream
+        self.group = group
+        self.name = name
+        self.block = block
+        self.ack_interval = ack_interval or Config.ACK_FLUSH_INTERVAL
+        self.group_ready = False
+        self.pending_acks = []
+        self.lock = threading.Lock()
+        self.round_trips = 0
+        self.received = 0
+        threading.Thread(target=self._flush_loop, name=f"{name}_acks", daemon=True).start()
+
+    def _take_acks(self):
+        with self.lock:
+            acks, self.pending_acks = self.pending_acks, []
+            return acks
+
+    def _restore_acks(self, acks):
+        with self.lock:
+            self.pending_acks[:0] = acks
+
+    def read(self, count=1):
+        """Flush buffered acks and read up to `count` new messages in one round trip"""
+        if not self.group_ready:
+            self.broker.ensure_group(self.group)
+            self.group_ready = True
+        acks = self._take_acks()
+        pipe = self.redis.pipeline(transaction=False)
+        if acks:
+            pipe.xack(self.stream, self.group, *acks)
+        pipe.xreadgroup(self.group, self.name, {self.stream: ">"}, count=count, block=self.block)
+        try:
+            results = pipe.execute()
+        except redis.exceptions.RedisError as e:
+            if "NOGROUP" in str(e):
+                self.group_ready = False  # stream or group was deleted, recreate on the next read
+            log(f"[Redis consume error] {e}")
+            self._restore_acks(acks)
+            return []
+        self.round_trips += 1
+        messages = decode_entries(results[-1][0][1]) if results[-1] else []
+        self.received += len(messages)
+        return messages
+
+    def ack(self, msg_id, wait=False):
+        """Buffer an ack; `wait=True` sends it (with any buffered ones) before returning"""
+        with self.lock:
+            self.pending_acks.append(msg_id)
+        if wait:
+            self.flush_acks()
+
+    def flush_acks(self):
+        acks = self._take_acks()
+        if not acks:
+            return
+        try:
+            self.redis.xack(self.stream, self.group, *acks)
+            self.round_trips += 1
+        except redis.exceptions.RedisError as e:
+            log(f"[Redis ack error] {e}")
+            self._restore_acks(acks)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.ack_interval)
+            self.flush_acks()
+
+    def log_stats(self):
+        per_job = self.round_trips / self.received if self.received else 0
+        log(f"[{self.name}] {self.received} messages in {self.round_trips} Redis round trips ({per_job:.2f} per job)")
+
+
 class RedisBroker:
     def __init__(self, stream="jobs"):
         self.redis = redis.Redis.from_url(Config.REDIS_URL)
         self.stream = stream
+        self.index = JobIndex(self.redis, stream)
+        self.consumers = {}
+
+    def consumer(self, group, name, block=5000):
+        """The StreamConsumer of this process for `group`; acks for the group are routed through it"""
+        if group not in self.consumers:
+            self.consumers[group] = StreamConsumer(self, group, name, block=block)
+        return self.consumers[group]
+
+    @staticmethod
+    def summary(data: dict):
+        """Compact fields kept in the job index for listings"""
+        def text(key):
+            value = data.get(key) or data.get(key.encode(), b"")
+            return value.decode() if isinstance(value, bytes) else value
+        return {"title": text("title") or text("keywords")}
+
+    @staticmethod
+    def encode(data: dict):
+        return {k: str(v).encode() if not isinstance(v, bytes) else v for k, v in data.items()}
 
     def publish(self, data: dict):
         """Send message to Redis Stream"""
-        data_bytes = {k: str(v).encode() for k, v in data.items()}
-        return self.redis.xadd(self.stream, data_bytes)
+        job_id = self.redis.xadd(self.stream, self.encode(data))
+        self.index.transition(job_id, "queued", **self.summary(data))
+        return job_id
 
-    def consume(self, group, consumer, block=5000, count=1):
-        """Reading a message from a Redis Stream by converting bytes to str"""
+    def publish_many(self, items, chunk_size=500):
+        """
+        Publish many jobs with pipelined XADDs: one round trip per chunk for the
+        stream and one for the job index. Returns the job ids in input order.
+        """
+        job_ids = []
+        for start in range(0, len(items), chunk_size):
+            chunk = items[start:start + chunk_size]
+            pipe = self.redis.pipeline(transaction=False)
+            for data in chunk:
+                pipe.xadd(self.stream, self.encode(data))
+            ids = pipe.execute()
+            job_ids.extend(ids)
+
+            pipe = self.redis.pipeline(transaction=False)
+            for job_id, data in zip(ids, chunk):
+                self.index.transition(job_id, "queued", client=pipe, **self.summary(data))
+            try:
+                pipe.execute()
+            except redis.exceptions.RedisError as e:
+                log(f"[JobIndex] Failed to index {len(ids)} published jobs: {e}")
+        return job_ids
+
+    def set_status(self, msg_id, status, **fields):
+        self.index.transition(msg_id, status, **fields)
+
+    def ensure_group(self, group):
         try:
             self.redis.xgroup_create(self.stream, group, id="0", mkstream=True)
         except redis.exceptions.ResponseError:
             pass
+
+    def consume(self, group, consumer, block=5000, count=1):
+        """Read up to `count` messages as [(stream, [(msg_id, fields)])] with str ids and fields"""
+        messages = self.consumer(group, consumer, block=block).read(count)
+        return [(self.stream, messages)] if messages else []
+
+    def claim_stale(self, group, consumer, min_idle_ms, count=10):
+        """
+        Take over messages another consumer read but never acked (e.g. it crashed),
+        once they have been idle for min_idle_ms. Returns [(msg_id, fields)].
+        """
+        claimed = []
+        start = "0-0"
+        self.ensure_group(group)
         try:
-            messages = self.redis.xreadgroup(group, consumer, {self.stream: ">"}, count=count, block=block)
-            # Convert bytes to str
-            converted = []
-            for stream_name, msgs in messages:
-                converted_msgs = []
-                for msg_id, fields in msgs:
-                    converted_fields = {k.decode(): v.decode() for k, v in fields.items()}
-                    converted_msgs.append((msg_id, converted_fields))
-                converted.append((stream_name, converted_msgs))
-            return converted
+            while len(claimed) < count:
+                res = self.redis.xautoclaim(self.stream, group, consumer, min_idle_ms, start_id=start, count=count - len(claimed))
+                start, msgs = res[0], res[1]
+                claimed.extend(decode_entries(msgs))
+                if start in (b"0-0", "0-0"):
+                    break
         except redis.exceptions.RedisError as e:
-            log(f"[Redis consume error] {e}")
-            return []
+            log(f"[Redis claim error] {e}")
+        return claimed
+
+    def prune_consumers(self, group, min_idle_ms, keep=None):
+        """
+        Delete consumers (left by exited processes) that have nothing pending and
+        have not read for min_idle_ms. Returns their names.
+        """
+        removed = []
+        try:
+            for info in self.redis.xinfo_consumers(self.stream, group):
+                name = info["name"].decode() if isinstance(info["name"], bytes) else info["name"]
+                if name != keep and not info["pending"] and info["idle"] >= min_idle_ms:
+                    self.redis.xgroup_delconsumer(self.stream, group, name)
+                    removed.append(name)
+        except redis.exceptions.RedisError as e:
+            log(f"[Redis consumer cleanup error] {e}")
+        return removed
+
+    def touch(self, group, consumer, msg_ids):
+        """Claim pending messages for `consumer` (which resets their idle time) without reading them again"""
+        try:
+            self.redis.xclaim(self.stream, group, consumer, 0, msg_ids, justid=True)
+        except redis.exceptions.RedisError as e:
+            log(f"[Redis claim error] {e}")
 
-    def ack(self, group, msg_id):
+    def ack(self, group, msg_id, wait=False):
+        """
+        Acks go through this process's consumer for the group when there is one,
+        batched with other acks unless `wait` is set
+        """
+        if group in self.consumers:
+            self.consumers[group].ack(msg_id, wait=wait)
+            return
         try:
             self.redis.xack(self.stream, group, msg_id)
         except redis.exceptions.RedisError as e:
@@ -0,0 +1,250 @@
+import argparse
+import gzip
+import json
+import os
+import time
+
+import redis
+
+from config import Config
+from messaging.job_index import JobIndex
+from messaging.redis_broker import RedisBroker
+from utils.helpers import log
+
+
+def parse_id(entry_id):
+    if isinstance(entry_id, bytes):
+        entry_id = entry_id.decode()
+    ms, _, seq = entry_id.partition("-")
+    return int(ms), int(seq or 0)
+
+
+def format_id(parsed):
+    return f"{parsed[0]}-{parsed[1]}"
+
+
+def _text(value):
+    # surrogateescape keeps arbitrary bytes round-trippable through JSON
+    return value.decode("utf-8", "surrogateescape") if isinstance(value, bytes) else value
+
+
+class SegmentArchive:
+    """
+    Append-only archive of trimmed stream entries: gzip'd JSON lines in
+    <dir>/<stream>/<first id>_<last id>.jsonl.gz. Segments are written to a
+    temp file and renamed, so a segment on disk is always complete.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory or Config.STREAM_ARCHIVE_DIR
+
+    def stream_dir(self, stream):
+        return os.path.join(self.directory, stream)
+
+    def write_segment(self, stream, entries):
+        directory = self.stream_dir(stream)
+        os.makedirs(directory, exist_ok=True)
+        first, last = _text(entries[0][0]), _text(entries[-1][0])
+        path = os.path.join(directory, f"{first}_{last}.jsonl.gz")
+        tmp = path + ".tmp"
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            for entry_id, fields in entries:
+                record = {"id": _text(entry_id), "fields": {_text(k): _text(v) for k, v in fields.items()}}
+                f.write(json.dumps(record) + "\n")
+        with open(tmp, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        return path
+
+    def segments(self, stream):
+        directory = self.stream_dir(stream)
+        if not os.path.isdir(directory):
+            return []
+        names = [n for n in os.listdir(directory) if n.endswith(".jsonl.gz")]
+        return [os.path.join(directory, n) for n in sorted(names, key=lambda n: parse_id(n.split("_")[0]))]
+
+    def read(self, stream, start=None, end=None):
+        """Yield (id, fields) in id order, each entry once even where segments overlap"""
+        start = parse_id(start) if start else None
+        end = parse_id(end) if end else None
+        last = None
+        for path in self.segments(stream):
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    record = json.loads(line)
+                    entry_id = parse_id(record["id"])
+                    if (last and entry_id <= last) or (start and entry_id < start):
+                        continue
+                    if end and entry_id > end:
+                        return
+                    last = entry_id
+                    fields = {k: v.encode("utf-8", "surrogateescape") for k, v in record["fields"].items()}
+                    yield record["id"], fields
+
+
+class StreamRetention:
+    """
+    Keeps a job stream bounded without losing work.
+
+    Entries are trimmed once they are older than `max_age` seconds or beyond
+    the newest `max_len`, but never at or past the oldest entry any consumer
+    group still has pending (or has not read yet). Everything trimmed is first
+    written to the segment archive; a cursor in Redis remembers how far the
+    archive goes, since approximate trimming can leave archived entries behind.
+    Job index entries (see JobIndex) older than the trim point are dropped
+    with the entries.
+    """
+
+    def __init__(self, redis_client, stream, max_age=None, max_len=None, archive=None, batch=1000):
+        self.redis = redis_client
+        self.stream = stream
+        self.max_age = Config.STREAM_RETENTION_MAX_AGE if max_age is None else max_age
+        self.max_len = Config.STREAM_RETENTION_MAX_LEN if max_len is None else max_len
+        self.archive = archive or SegmentArchive()
+        self.index = JobIndex(redis_client, stream)
+        self.batch = batch
+        self.cursor_key = f"stream_archive:{stream}:cursor"
+        self.lock_key = f"stream_retention:{stream}:lock"
+        self._last_run = 0
+
+    def safe_boundary(self):
+        """First entry id that must be kept for the consumer groups, or None if there are no groups"""
+        try:
+            groups = self.redis.xinfo_groups(self.stream)
+        except redis.exceptions.ResponseError:
+            return None  # stream does not exist yet
+        boundary = None
+        for group in groups:
+            name = group["name"]
+            if group["pending"]:
+                keep = parse_id(self.redis.xpending(self.stream, name)["min"])
+            else:
+                ms, seq = parse_id(group["last-delivered-id"])
+                keep = (ms, seq + 1)
+            boundary = keep if boundary is None else min(boundary, keep)
+        return boundary
+
+    def _cursor(self):
+        value = self.redis.get(self.cursor_key)
+        return parse_id(value) if value else None
+
+    def trim(self):
+        """Archive and trim what the policy allows; returns the number of entries archived"""
+        if not (self.max_age or self.max_len):
+            return 0
+        boundary = self.safe_boundary()
+        if boundary is None:
+            return 0
+        age_cut = (int((time.time() - self.max_age) * 1000), 0) if self.max_age else None
+        excess = self.redis.xlen(self.stream) - self.max_len if self.max_len else 0
+        cursor = self._cursor()
+
+        pending, archived, seen, keep_from = [], 0, 0, None
+        start = "-"
+        while keep_from is None:
+            entries = self.redis.xrange(self.stream, min=start, max="+", count=self.batch)
+            if not entries:
+                break
+            for entry_id, fields in entries:
+                parsed = parse_id(entry_id)
+                expired = (age_cut and parsed < age_cut) or seen < excess
+                if parsed >= boundary or not expired:
+                    keep_from = parsed
+                    break
+                seen += 1
+                if cursor is None or parsed > cursor:
+                    pending.append((entry_id, fields))
+            if len(pending) >= Config.STREAM_ARCHIVE_SEGMENT:
+                archived += self._archive(pending)
+                pending = []
+            start = "(" + _text(entries[-1][0])
+
+        if pending:
+            archived += self._archive(pending)
+        if keep_from is None and seen:
+            # everything left in the stream may go
+            last = parse_id(self.redis.get(self.cursor_key))
+            keep_from = (last[0], last[1] + 1)
+        if keep_from is not None and seen:
+            trimmed = self.redis.xtrim(self.stream, minid=format_id(keep_from), approximate=True)
+            unindexed = self.index.remove_before(format_id(keep_from))
+            if trimmed or archived or unindexed:
+                log(
+                    f"[Retention] {self.stream}: archived {archived}, trimmed {trimmed} entries and "
+                    f"{unindexed} index entries older than {format_id(keep_from)}"
+                )
+        return archived
+
+    def _archive(self, entries):
+        path = self.archive.write_segment(self.stream, entries)
+        self.redis.set(self.cursor_key, _text(entries[-1][0]))
+        log(f"[Retention] {self.stream}: archived {len(entries)} entries to {path}")
+        return len(entries)
+
+    def run_if_due(self):
+        """Trim at most every Config.STREAM_RETENTION_INTERVAL seconds, one process per stream at a time"""
+        if time.monotonic() - self._last_run < Config.STREAM_RETENTION_INTERVAL:
+            return
+        self._last_run = time.monotonic()
+        if not self.redis.set(self.lock_key, os.getpid(), nx=True, ex=Config.STREAM_RETENTION_INTERVAL):
+            return
+        try:
+            self.trim()
+        finally:
+            self.redis.delete(self.lock_key)
+
+    def stats(self):
+        try:
+            info = self.redis.xinfo_stream(self.stream)
+        except redis.exceptions.ResponseError:
+            return {"stream": self.stream, "length": 0, "memory_bytes": 0}
+        cursor = self.redis.get(self.cursor_key)
+        return {
+            "stream": self.stream,
+            "length": info["length"],
+            "memory_bytes": self.redis.memory_usage(self.stream, samples=0) or 0,
+            "first_id": _text(info["first-entry"][0]) if info.get("first-entry") else None,
+            "last_id": _text(info["last-entry"][0]) if info.get("last-entry") else None,
+            "groups": info["groups"],
+            "archived_through": _text(cursor) if cursor else None,
+            "archive_segments": len(self.archive.segments(self.stream)),
+        }
+
+    def log_stats(self):
+        s = self.stats()
+        log(
+            f"[Retention] {s['stream']}: {s['length']} entries, {s['memory_bytes'] / 1024:.0f} KiB, "
+            f"archived through {s.get('archived_through')}"
+        )
+
+    def replay(self, target=None, start=None, end=None, chunk_size=500):
+        """Publish archived entries (optionally an id range) again, to `target` or the original stream"""
+        broker = RedisBroker(stream=target or self.stream)
+        chunk, total = [], 0
+        for _, fields in self.archive.read(self.stream, start, end):
+            chunk.append(fields)
+            if len(chunk) >= chunk_size:
+                total += len(broker.publish_many(chunk, chunk_size))
+                chunk = []
+        if chunk:
+            total += len(broker.publish_many(chunk, chunk_size))
+        log(f"[Retention] Replayed {total} archived {self.stream} entries into {broker.stream}")
+        return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Job stream retention: stats, trim and archive replay")
+    parser.add_argument("command", choices=["stats", "trim", "replay"])
+    parser.add_argument("stream", help="e.g. article_jobs or product_jobs")
+    parser.add_argument("--target", help="replay into this stream instead of the original")
+    parser.add_argument("--start", help="first entry id to replay")
+    parser.add_argument("--end", help="last entry id to replay")
+    args = parser.parse_args()
+
+    retention = StreamRetention(redis.Redis.from_url(Config.REDIS_URL), args.stream)
+    if args.command == "stats":
+        print(json.dumps(retention.stats(), indent=2))
+    elif args.command == "trim":
+        retention.trim()
+    else:
+        retention.replay(args.target, args.start, args.end)
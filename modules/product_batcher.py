@@ -0,0 +1,88 @@
+import threading
+import time
+
+from clients.retry_policy import CircuitOpenError
+from config import Config
+from utils.helpers import log
+
+
+class ProductBatcher:
+    """
+    Accumulates prepared products and creates them through /products/batch.
+
+    A batch is flushed when it reaches `max_size` items or when its oldest item
+    has waited `max_wait` seconds. `on_result(msg_id, product, error)` is called
+    once per item so every stream message is acked or failed on its own.
+    """
+
+    def __init__(self, wp_module, on_result, max_size=None, max_wait=None, upload_images=False):
+        self.wp_module = wp_module
+        self.on_result = on_result
+        self.max_size = max_size or Config.PRODUCT_BATCH_SIZE
+        self.max_wait = max_wait or Config.PRODUCT_BATCH_WAIT
+        self.upload_images = upload_images
+        self.items = []
+        self.first_added = None
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        threading.Thread(target=self._timer, name="product_batcher", daemon=True).start()
+
+    def add(self, msg_id, product_kwargs):
+        with self.lock:
+            if not self.items:
+                self.first_added = time.monotonic()
+            self.items.append((msg_id, product_kwargs))
+            full = len(self.items) >= self.max_size
+        if full:
+            self.flush()
+
+    def msg_ids(self):
+        """Ids of the messages waiting in the batch, still unacked"""
+        with self.lock:
+            return [msg_id for msg_id, _ in self.items]
+
+    def _take(self):
+        with self.lock:
+            items, self.items = self.items, []
+            self.first_added = None
+            return items
+
+    def _timer(self):
+        while True:
+            time.sleep(min(0.5, self.max_wait))
+            with self.lock:
+                due = self.items and time.monotonic() - self.first_added >= self.max_wait
+            if due:
+                self.flush()
+
+    def flush(self):
+        with self.flush_lock:
+            items = self._take()
+            if not items:
+                return
+            log(f"[ProductBatcher] Creating {len(items)} products in one batch")
+            try:
+                results = self.wp_module.create_products_batch(
+                    [kwargs for _, kwargs in items], upload_images=self.upload_images
+                )
+            except CircuitOpenError as e:
+                results = [{"retry": e}] * len(items)
+            except Exception as e:
+                results = [{"error": str(e)}] * len(items)
+
+            # Site went down before these were sent: keep them for a flush after the breaker may have reset
+            unsent = [item for item, result in zip(items, results) if "retry" in result]
+            if unsent:
+                retry_in = next(result["retry"] for result in results if "retry" in result).retry_in
+                log(f"[ProductBatcher] Site unavailable; keeping {len(unsent)} unsent products for the next flush")
+                with self.lock:
+                    self.items = unsent + self.items
+                    self.first_added = time.monotonic() - self.max_wait + retry_in
+
+            for (msg_id, _), result in zip(items, results):
+                if "retry" in result:
+                    continue
+                try:
+                    self.on_result(msg_id, result.get("product"), result.get("error"))
+                except Exception as e:
+                    log(f"[ProductBatcher] Result handler failed for {msg_id}: {e}")
@@ -0,0 +1,145 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from config import Config
+from utils.helpers import log
+
+
+class Step:
+    """
+    One pipeline step.
+
+    fn(context) returns a dict with the step's `outputs`. A step becomes ready
+    once all its `inputs` are in the context and every step named in `after`
+    has finished (done, failed or skipped). A failing `optional` step does not
+    fail the job; steps that need its outputs are skipped instead.
+    """
+
+    def __init__(self, name, fn, inputs=(), outputs=(), after=(), optional=False, enabled=True):
+        self.name = name
+        self.fn = fn
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.after = tuple(getattr(a, "value", a) for a in after)
+        self.optional = optional
+        self.enabled = enabled
+
+    @property
+    def label(self):
+        return getattr(self.name, "value", self.name)
+
+
+class StepFailed(Exception):
+    def __init__(self, step, error):
+        super().__init__(f"Step {step.label} failed: {error}")
+        self.step = step
+        self.error = error
+
+
+class StepEngine:
+    """Runs a set of steps as a dependency graph, independent steps in parallel"""
+
+    def __init__(self, steps, executor=None):
+        self.steps = [s for s in steps if s.enabled]
+        self.executor = executor or ThreadPoolExecutor(max_workers=Config.STEP_ENGINE_WORKERS, thread_name_prefix="step")
+
+    def _run_step(self, step, context):
+        start = time.monotonic()
+        result = step.fn(context) or {}
+        return result, time.monotonic() - start
+
+    def resumable(self, context, completed):
+        """
+        Labels of steps that need not run again: steps listed in `completed`
+        (a persisted cursor) or whose outputs are all in `context`, as long as
+        every output missing from `context` is only consumed by steps that are
+        themselves resumable.
+        """
+        done = {s.label for s in self.steps if s.label in completed or (s.outputs and all(k in context for k in s.outputs))}
+        changed = True
+        while changed:
+            changed = False
+            for step in self.steps:
+                if step.label not in done:
+                    continue
+                for key in step.outputs:
+                    if key in context:
+                        continue
+                    if any(key in c.inputs and c.label not in done for c in self.steps):
+                        done.discard(step.label)
+                        changed = True
+                        break
+        return done
+
+    def run(self, context, job_id="", on_step_done=None, completed=()):
+        """
+        Execute every step once, skipping those that are resumable from `context`
+        and the `completed` cursor. on_step_done(step, outputs) fires after each
+        step that is finished for good: successful, skipped, or failed but optional. Returns {step: seconds | "resumed" | "skipped" | "failed"}.
+        """
+        timings = {}
+        # `after` on a disabled step is treated as already satisfied
+        finished = {a for s in self.steps for a in s.after} - {s.label for s in self.steps}
+        unavailable = set()
+        pending = []
+        resumed = self.resumable(context, set(completed))
+        for step in self.steps:
+            if step.label in resumed:
+                finished.add(step.label)
+                timings[step.label] = "resumed"
+            else:
+                pending.append(step)
+
+        running = {}
+        failure = None
+        while pending or running:
+            for step in list(pending):
+                if failure:
+                    break
+                if not all(a in finished for a in step.after):
+                    continue
+                if any(k in unavailable for k in step.inputs):
+                    pending.remove(step)
+                    finished.add(step.label)
+                    unavailable.update(step.outputs)
+                    timings[step.label] = "skipped"
+                    log(f"[{job_id}] Skipping step {step.label}: missing inputs")
+                    if on_step_done:
+                        on_step_done(step, {})
+                    continue
+                if all(k in context for k in step.inputs):
+                    pending.remove(step)
+                    log(f"[{job_id}] Running step: {step.label}")
+                    running[self.executor.submit(self._run_step, step, dict(context))] = step
+
+            if not running:
+                if failure or not pending:
+                    break
+                raise RuntimeError(f"Steps can never run: {[s.label for s in pending]}")
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                step = running.pop(future)
+                finished.add(step.label)
+                try:
+                    outputs, elapsed = future.result()
+                except Exception as e:
+                    timings[step.label] = "failed"
+                    if step.optional:
+                        log(f"[{job_id}] ⚠️ Optional step {step.label} failed: {e}")
+                        unavailable.update(step.outputs)
+                        if on_step_done:
+                            on_step_done(step, {})
+                    elif failure is None:
+                        failure = StepFailed(step, e)
+                    continue
+
+                timings[step.label] = round(elapsed, 3)
+                context.update(outputs)
+                if on_step_done:
+                    on_step_done(step, outputs)
+
+        log(f"[{job_id}] Step timings: {timings}")
+        if failure:
+            raise failure
+        return timings
@@ -1,15 +1,44 @@
 import os
 # import time
+from concurrent.futures import ThreadPoolExecutor
 
-from typing import List, Union, Optional
+from typing import Dict, List, Union, Optional
 
-from clients.woocommerce_client import WooCommerceClient
+from clients.woocommerce_client import WC_BATCH_LIMIT, WooCommerceClient
+from clients.retry_policy import CircuitOpenError
+from config import Config
 
 class WordPressProductModule:
     def __init__(self):
         self.wp = WooCommerceClient()
+        # shared by all jobs of the process, so concurrent products don't multiply the limit
+        self.media_pool = ThreadPoolExecutor(max_workers=Config.MEDIA_UPLOAD_CONCURRENCY, thread_name_prefix="media")
 
-    def create_product(
+    def resolve_taxonomy(self, products: List[dict]) -> Dict[str, Dict[str, int]]:
+        """
+        Resolve the categories and tags of one or many products in bulk.
+        `products` is a list of dicts with optional "category" and "tags" keys.
+        Returns {"categories": {name: id}, "tags": {name: id}}.
+        """
+        categories, tags = [], []
+        for p in products:
+            if p.get("category"):
+                categories.append(p["category"])
+            tags.extend(p.get("tags") or [])
+
+        term_ids = {"categories": {}, "tags": {}}
+        for kind, names in (("categories", categories), ("tags", tags)):
+            if not names:
+                continue
+            try:
+                term_ids[kind] = self.wp.resolve_terms(kind, names)
+            except CircuitOpenError:
+                raise
+            except Exception as e:
+                print(f"⚠️ {kind.capitalize()} error: {e}")
+        return term_ids
+
+    def build_product_payload(
         self,
         title: str,
         description: str,
@@ -18,36 +47,36 @@ class WordPressProductModule:
         category: Optional[str] = None,
         brand: Optional[str] = None,
         tags: Optional[List[str]] = None,
-        images: Optional[List[str]] = None,  # list of URLs or local file paths
         meta_title: Optional[str] = None,
         meta_description: Optional[str] = None,
         keywords: Optional[str] = None,
         color: Optional[str] = None,
         stock_quantity: Optional[Union[int, str]] = None,
         status: str = "publish",
-        upload_images: bool = True
-    ):
-        # --- category ---
+        term_ids: Optional[Dict[str, Dict[str, int]]] = None
+    ) -> dict:
+        """WooCommerce product payload (without images) for create_product / create_products_batch"""
+
+        # --- category & tags (resolved in bulk) ---
+        tags = [t.strip() for t in (tags or []) if t and t.strip()]
+        if term_ids is None:
+            term_ids = self.resolve_taxonomy([{"category": category, "tags": tags}])
+
         categories = []
         if category:
-            try:
-                cat_id = self.wp.get_or_create_category(category)
+            cat_id = term_ids["categories"].get(category.strip())
+            if cat_id:
                 categories.append({"id": cat_id})
-            except Exception as e:
-                print(f"⚠️ Category error: {e}")
+            else:
+                print(f"⚠️ Category error: could not resolve '{category}'")
 
-        # --- tags ---
         tags_data = []
-        if tags:
-            for t in tags:
-                t = t.strip()
-                if not t:
-                    continue
-                try:
-                    tag_id = self.wp.get_or_create_tag(t)
-                    tags_data.append({"id": tag_id})
-                except Exception as e:
-                    print(f"⚠️ Tag error: {e}")
+        for t in tags:
+            tag_id = term_ids["tags"].get(t)
+            if tag_id:
+                tags_data.append({"id": tag_id})
+            else:
+                print(f"⚠️ Tag error: could not resolve '{t}'")
 
         # --- attributes (color) ---
         attributes = []
@@ -111,7 +140,80 @@ class WordPressProductModule:
         else:
             # If the user hasn't entered anything, WooCommerce will set the status itself
             data["stock_status"] = "instock"
-            
+
+        return data
+
+    def _upload_local_image(self, path, product_id):
+        try:
+            return self.wp.upload_product_media_file(product_id, os.path.abspath(path))
+        except CircuitOpenError:
+            raise
+        except Exception as e:
+            print(f"⚠️ Image upload error for {path}: {e}")
+            return None
+
+    def _images_payload(self, images, product_id=None, upload_images=True):
+        """
+        Prepare images as a list of {"src": url} or {"id": media_id} keeping their position.
+        Local files are uploaded first, concurrently on the shared media pool and streamed
+        from disk (attached to product_id when it is already known).
+        """
+        images_payload = []
+        uploads = {}
+        for i, img in enumerate(images or []):
+            if not img:
+                continue
+            img = img.strip()
+
+            if img.startswith("http://") or img.startswith("https://"):
+                # ✅ Just attach, don't re-upload
+                images_payload.append({"src": img, "position": i})
+            elif upload_images:
+                uploads[i] = self.media_pool.submit(self._upload_local_image, img, product_id)
+
+        for i, future in uploads.items():
+            media_id = future.result()  # re-raises CircuitOpenError
+            if media_id:
+                images_payload.append({"id": media_id, "position": i})
+        images_payload.sort(key=lambda image: image["position"])
+        return images_payload
+
+    def create_product(
+        self,
+        title: str,
+        description: str,
+        price: float = 0,
+        sale_price: Optional[float] = None,
+        category: Optional[str] = None,
+        brand: Optional[str] = None,
+        tags: Optional[List[str]] = None,
+        images: Optional[List[str]] = None,  # list of URLs or local file paths
+        meta_title: Optional[str] = None,
+        meta_description: Optional[str] = None,
+        keywords: Optional[str] = None,
+        color: Optional[str] = None,
+        stock_quantity: Optional[Union[int, str]] = None,
+        status: str = "publish",
+        upload_images: bool = True,
+        term_ids: Optional[Dict[str, Dict[str, int]]] = None
+    ):
+        data = self.build_product_payload(
+            title,
+            description,
+            price=price,
+            sale_price=sale_price,
+            category=category,
+            brand=brand,
+            tags=tags,
+            meta_title=meta_title,
+            meta_description=meta_description,
+            keywords=keywords,
+            color=color,
+            stock_quantity=stock_quantity,
+            status=status,
+            term_ids=term_ids,
+        )
+
         # 1) Create product first (without images)
         product = self.wp.create_product(data)
         product_id = product.get("id") if isinstance(product, dict) else None
@@ -120,34 +222,7 @@ class WordPressProductModule:
             raise Exception("❌ Failed to create product in WordPress.")
 
         # 2) Handle images:
-        # prepare images_payload as list of {"src": url} or {"id": media_id}
-        # --- inside create_product ---
-        images_payload = []
-        if images:
-            for i, img in enumerate(images):
-                if not img:
-                    continue
-                img = img.strip()
-
-                if img.startswith("http://") or img.startswith("https://"):
-                    # ✅ Just attach, don't re-upload
-                    images_payload.append({"src": img, "position": i})
-                else:
-                    # If you have a local path and upload_images = True
-                    if upload_images:
-                        try:
-                            abs_path = os.path.abspath(img)
-                            with open(abs_path, "rb") as f:
-                                image_bytes = f.read()
-                            media_id = self.wp.upload_product_media(
-                                product_id,
-                                image_bytes,
-                                filename=os.path.basename(abs_path)
-                            )
-                            if media_id:
-                                images_payload.append({"id": media_id, "position": i})
-                        except Exception as e:
-                            print(f"⚠️ Image upload error for {img}: {e}")
+        images_payload = self._images_payload(images, product_id, upload_images)
 
         # Attach images to the product (only once)
         if images_payload:
@@ -161,5 +236,60 @@ class WordPressProductModule:
         # else: no images provided — fine.
         return product  # ✅ just return created product if no images
 
+    def create_products_batch(self, products: List[dict], upload_images: bool = True) -> List[dict]:
+        """
+        Create many products with /products/batch, images included in the create.
+        `products` are create_product keyword arguments. Returns one entry per product,
+        in order: {"product": {...}} on success, {"error": "..."} on failure, or
+        {"retry": CircuitOpenError} for products not sent because the site went down
+        after earlier chunks had been created.
+        """
+        term_ids = self.resolve_taxonomy(products)
+
+        results = [None] * len(products)
+        payloads = []
+        for i, kwargs in enumerate(products):
+            kwargs = dict(kwargs)
+            images = kwargs.pop("images", None)
+            kwargs.pop("upload_images", None)
+            kwargs.pop("term_ids", None)
+            try:
+                data = self.build_product_payload(term_ids=term_ids, **kwargs)
+                images_payload = self._images_payload(images, upload_images=upload_images)
+                if images_payload:
+                    data["images"] = images_payload
+                payloads.append((i, data))
+            except CircuitOpenError:
+                raise  # nothing was sent yet, the caller retries the whole batch
+            except Exception as e:
+                results[i] = {"error": f"Invalid product payload: {e}"}
+
+        for start in range(0, len(payloads), WC_BATCH_LIMIT):
+            chunk = payloads[start:start + WC_BATCH_LIMIT]
+            try:
+                res = self.wp.batch_products(create=[data for _, data in chunk])
+                created = res.get("create", [])
+            except CircuitOpenError as e:
+                if not start:
+                    raise
+                for i, _ in payloads[start:]:
+                    results[i] = {"retry": e}
+                break
+            except Exception as e:
+                created = []
+                error = str(e)
+            else:
+                error = "Missing result in batch response"
+
+            for pos, (i, _) in enumerate(chunk):
+                item = created[pos] if pos < len(created) else None
+                if item is None:
+                    results[i] = {"error": error}
+                elif item.get("error"):
+                    results[i] = {"error": item["error"].get("message", str(item["error"]))}
+                else:
+                    results[i] = {"product": item}
+        return results
+
     def upload_media(self, product_id, image_bytes, filename="image.jpg"):
         return self.wp.upload_product_media(product_id, image_bytes, filename)
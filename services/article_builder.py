@@ -1,11 +1,19 @@
 import re
 import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from clients.openrouter_client import OpenRouterClient
+from config import Config
+from utils.json_stream import IncrementalJSONParser
+
+OUTLINE_TOKENS = 600
+
 
 class ArticleBuilder:
     def __init__(self, client=None):
         self.client = client or OpenRouterClient()
+        # shared by all jobs of the process, so it bounds the chapter requests in flight
+        self.pool = ThreadPoolExecutor(max_workers=Config.ARTICLE_CHAPTER_CONCURRENCY, thread_name_prefix="chapter")
         logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(message)s')
 
     def safe_json_load(self, content):
@@ -33,7 +41,10 @@ class ArticleBuilder:
         tone="informative",
         audience="general",
         max_tokens=2000,
-        include_sections=None
+        include_sections=None,
+        stream=None,
+        on_field=None,
+        outline=None
     ):
         """
         Build a detailed SEO-friendly article structure.
@@ -44,21 +55,29 @@ class ArticleBuilder:
             audience: target audience
             max_tokens: approximate max tokens for the article
             include_sections: list of optional fields ['title', 'subtitle', 'introduction', 'conclusions', 'imagePrompt', 'chapters']
+            stream: read the completion as a stream and parse it incrementally (default Config.LLM_STREAMING)
+            on_field: callback(key, value) fired as soon as each field / chapter is complete (stream and outline mode)
+            outline: generate an outline first, then the chapters in parallel (default Config.ARTICLE_OUTLINE)
         """
-        include_sections = include_sections or ["title", "subtitle", "introduction", "conclusions", "imagePrompt", "chapters"]
+        outline = Config.ARTICLE_OUTLINE if outline is None else outline
+        if outline:
+            return self.build_outlined(keywords, num_chapters, tone, audience, max_tokens, include_sections, on_field)
 
-        prompt = f"""
-        Write a SEO-friendly article based on the topic "{keywords}".
-        Output only valid JSON with the following structure:
-        Tone: {tone}
-        Audience: {audience}
-        Output only valid JSON including fields: {include_sections}.
-        Use HTML formatting, no Markdown.
-        - Use {num_chapters} chapters.
-        - Output only valid JSON.
-        - Use HTML for bold, italic, lists; no Markdown.
-        - Chapters must be related and fluent.
-        """
+        stream = Config.LLM_STREAMING if stream is None else stream
+        if stream:
+            article_json = {}
+            for key, value in self.stream_structure(keywords, num_chapters, tone, audience, max_tokens, include_sections):
+                if key.endswith("[]"):
+                    article_json.setdefault(key[:-2], []).append(value)
+                else:
+                    article_json[key] = value
+                if on_field:
+                    on_field(key, value)
+            if not article_json:
+                raise ValueError("Failed to parse JSON from OpenRouter stream")
+            return article_json
+
+        prompt = self._structure_prompt(keywords, num_chapters, tone, audience, include_sections)
 
         try:
             res = self.client.chat([{"role": "user", "content": prompt}], max_tokens=max_tokens)
@@ -73,4 +92,151 @@ class ArticleBuilder:
             logging.error(f"Error parsing OpenRouter response: {e}")
             raise
 
-        return article_json
\ No newline at end of file
+        return article_json
+
+    def stream_structure(self, keywords, num_chapters=5, tone="informative", audience="general", max_tokens=2000, include_sections=None):
+        """
+        Stream the article: yields (field, value) as soon as each top-level field is complete
+        and ("chapters[]", chapter) for every finished chapter.
+        """
+        prompt = self._structure_prompt(keywords, num_chapters, tone, audience, include_sections)
+        parser = IncrementalJSONParser(stream_keys=("chapters",))
+        try:
+            for delta in self.client.chat_stream([{"role": "user", "content": prompt}], max_tokens=max_tokens):
+                for key, value in parser.feed(delta):
+                    logging.info(f"Streamed field ready: {key}")
+                    yield key, value
+                if parser.done:
+                    break
+            if not parser.done:
+                raise ValueError("OpenRouter stream ended before the article JSON was complete")
+        except json.JSONDecodeError as e:
+            logging.error(f"JSON decode error in streamed article: {e}")
+            raise ValueError("Failed to parse JSON from OpenRouter stream") from e
+
+    def build_outlined(self, keywords, num_chapters=5, tone="informative", audience="general", max_tokens=2000, include_sections=None, on_field=None):
+        """
+        Outline-then-chapters generation: one short request for the title, image
+        prompt and chapter plan, then the introduction, every chapter and the
+        conclusions each in their own request on self.pool. Returns the same
+        structure as build_structure; a failed part is retried on its own
+        instead of regenerating the whole article.
+        """
+        include_sections = include_sections or ["title", "subtitle", "introduction", "conclusions", "imagePrompt", "chapters"]
+        outline = self._part("outline", self._outline_prompt(keywords, num_chapters, tone, audience), OUTLINE_TOKENS, as_json=True)
+        plan = [{"title": c} if isinstance(c, str) else c for c in outline.get("chapters") or []][:num_chapters]
+        if not plan:
+            raise ValueError("Outline from OpenRouter has no chapters")
+        logging.info(f"Outline ready: {outline.get('title')} ({len(plan)} chapters)")
+
+        article = {k: outline[k] for k in ("title", "subtitle", "imagePrompt") if k in include_sections and k in outline}
+        if on_field:
+            for key, value in article.items():
+                on_field(key, value)
+
+        # the article budget is split over the chapters; introduction and conclusions are short
+        chapter_tokens = max(max_tokens // len(plan), 300)
+        edge_tokens = min(chapter_tokens, 400)
+        title = outline.get("title") or keywords
+        futures = {}
+        if "introduction" in include_sections:
+            futures["introduction"] = self.pool.submit(
+                self._part, "introduction", self._edge_prompt("introduction", keywords, title, plan, tone, audience), edge_tokens)
+        if "chapters" in include_sections:
+            for i, chapter in enumerate(plan):
+                futures[i] = self.pool.submit(
+                    self._part, f"chapter {i + 1}", self._chapter_prompt(keywords, title, plan, i, tone, audience), chapter_tokens)
+        if "conclusions" in include_sections:
+            futures["conclusions"] = self.pool.submit(
+                self._part, "conclusions", self._edge_prompt("conclusions", keywords, title, plan, tone, audience), edge_tokens)
+
+        for key, future in futures.items():
+            try:
+                value = future.result()
+            except Exception:
+                for other in futures.values():
+                    other.cancel()  # parts not started yet are not worth paying for
+                raise
+            if isinstance(key, int):
+                value = {"title": plan[key].get("title", ""), "content": value}
+                article.setdefault("chapters", []).append(value)
+                key = "chapters[]"
+            else:
+                article[key] = value
+            if on_field:
+                on_field(key, value)
+        return article
+
+    def _part(self, label, prompt, max_tokens, as_json=False):
+        """One completion of an outlined article: HTML text, or a dict with as_json; tried twice"""
+        messages = [{"role": "user", "content": prompt}]
+        for attempt in (1, 2):
+            try:
+                res = self.client.chat(messages, max_tokens=max_tokens)
+                content = res["choices"][0]["message"]["content"] or ""
+                if as_json:
+                    value = self.safe_json_load(content)
+                else:
+                    value = re.sub(r"^```(?:html)?|```$", "", content.strip(), flags=re.MULTILINE).strip()
+                if not value:
+                    raise ValueError(f"Empty or malformed {label} from OpenRouter")
+                return value
+            except Exception as e:
+                logging.error(f"Article {label} failed (attempt {attempt}): {e}")
+                # a bad answer must not be served again, on the retry or to later articles
+                self.client.uncache(messages, max_tokens=max_tokens)
+                if attempt == 2:
+                    raise
+
+    def _outline_prompt(self, keywords, num_chapters, tone, audience):
+        return f"""
+        Plan a SEO-friendly article on the topic "{keywords}".
+        Tone: {tone}
+        Audience: {audience}
+        Output only valid JSON with the fields: title, subtitle, imagePrompt, chapters.
+        - chapters is a list of exactly {num_chapters} objects with "title" and a one-sentence "summary".
+        - Keep it short: no article text, only the plan.
+        """
+
+    def _chapter_prompt(self, keywords, title, plan, index, tone, audience):
+        chapter = plan[index]
+        others = "; ".join(c.get("title", "") for j, c in enumerate(plan) if j != index)
+        return f"""
+        Write chapter {index + 1} of {len(plan)} of the SEO-friendly article "{title}" on the topic "{keywords}".
+        Tone: {tone}
+        Audience: {audience}
+        Chapter title: {chapter.get("title", "")}
+        Chapter summary: {chapter.get("summary", "")}
+        Other chapters (do not repeat their content): {others}
+        - Output only the chapter body, without its title.
+        - Use HTML for paragraphs, bold, italic, lists; no Markdown, no JSON.
+        """
+
+    def _edge_prompt(self, section, keywords, title, plan, tone, audience):
+        chapters = "; ".join(c.get("title", "") for c in plan)
+        return f"""
+        Write the {section} of the SEO-friendly article "{title}" on the topic "{keywords}".
+        Tone: {tone}
+        Audience: {audience}
+        The article's chapters: {chapters}
+        - One or two short paragraphs.
+        - Output only the {section} text, without a heading.
+        - Use HTML for paragraphs, bold, italic; no Markdown, no JSON.
+        """
+
+    def _structure_prompt(self, keywords, num_chapters, tone, audience, include_sections):
+        include_sections = include_sections or ["title", "subtitle", "introduction", "conclusions", "imagePrompt", "chapters"]
+
+        prompt = f"""
+        Write a SEO-friendly article based on the topic "{keywords}".
+        Output only valid JSON with the following structure:
+        Tone: {tone}
+        Audience: {audience}
+        Output only valid JSON including fields: {include_sections}.
+        Use HTML formatting, no Markdown.
+        - Use {num_chapters} chapters.
+        - Output only valid JSON.
+        - Use HTML for bold, italic, lists; no Markdown.
+        - Chapters must be related and fluent.
+        """
+        return prompt
@@ -5,6 +5,7 @@ import sys
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from messaging.redis_broker import RedisBroker
+from services.product_ingest import ProductIngest, detect_format, iter_rows
 from utils.helpers import log
 
 template_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "templates")
@@ -37,3 +38,24 @@ def publish_product():
     log(f"Published product job id: {job_id}")
     return jsonify({"job_id": str(job_id, 'utf-8'), "status": "queued"})
 
+
+@product_bp.route("/bulk", methods=["POST"])
+def bulk_publish():
+    """
+    Queue many products at once from a CSV (header row first) or NDJSON upload,
+    sent either as the raw request body (Content-Type text/csv or
+    application/x-ndjson, or ?format=csv|ndjson) or as the `file` form field.
+    The body is parsed while it is read, so large catalogs are not held in memory.
+    """
+    upload = request.files.get("file") if request.mimetype == "multipart/form-data" else None
+    if upload:
+        fmt = detect_format(upload.mimetype, upload.filename, request.args.get("format"))
+        stream = upload.stream
+    else:
+        fmt = detect_format(request.mimetype, requested=request.args.get("format"))
+        stream = request.stream
+    if not fmt:
+        return jsonify({"error": "send CSV or NDJSON (Content-Type, file extension or ?format=csv|ndjson)"}), 400
+
+    result = ProductIngest(broker).run(iter_rows(stream, fmt))
+    return jsonify(result)
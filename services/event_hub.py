@@ -0,0 +1,115 @@
+import queue
+import re
+import threading
+
+import redis
+
+from config import Config
+from messaging.job_index import EVENTS_STREAM
+from utils.helpers import log
+
+
+def _id_tuple(event_id):
+    ms, _, seq = event_id.partition("-")
+    return int(ms), int(seq or 0)
+
+
+def valid_event_id(event_id):
+    """True for a stream id ("<ms>" or "<ms>-<seq>") a client may resume from"""
+    return bool(re.fullmatch(r"\d+(-\d+)?", event_id or ""))
+
+
+class EventHub:
+    """
+    Fans job status events out to Server-Sent Events clients.
+
+    A single background thread tails the jobs:events stream with a blocking
+    XREAD and pushes every event to each subscriber's queue, so the number of
+    open dashboards does not change the load on Redis. A reconnecting client
+    passes its Last-Event-ID and first receives what it missed via XRANGE.
+    """
+
+    def __init__(self, redis_client=None, stream=EVENTS_STREAM, queue_size=1000):
+        self.redis = redis_client or redis.Redis.from_url(Config.REDIS_URL, decode_responses=True)
+        self.stream = stream
+        self.queue_size = queue_size
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def _ensure_started(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._tail, name="event_hub", daemon=True)
+                self.thread.start()
+
+    def _tail(self):
+        last_id = "$"
+        while True:
+            try:
+                res = self.redis.xread({self.stream: last_id}, block=5000, count=100)
+            except redis.exceptions.RedisError as e:
+                log(f"[EventHub] Redis read error: {e}")
+                threading.Event().wait(2)
+                continue
+            for _, entries in res or []:
+                for event_id, fields in entries:
+                    last_id = event_id
+                    self._broadcast((event_id, fields))
+
+    def _broadcast(self, event):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait(event)
+            except queue.Full:
+                # too slow to keep up: drop it, the browser reconnects with its Last-Event-ID.
+                # Never block here, a stalled client would stop the feed for everyone.
+                self.unsubscribe(q)
+                try:
+                    while True:
+                        q.get_nowait()
+                except queue.Empty:
+                    pass
+                try:
+                    q.put_nowait(None)
+                except queue.Full:
+                    pass
+
+    def unsubscribe(self, q):
+        with self.lock:
+            self.subscribers.discard(q)
+
+    def listen(self, last_event_id=None, heartbeat=None):
+        """
+        Yield (event_id, fields) events, or None every `heartbeat` seconds of silence.
+        Missed events after `last_event_id` come first; an invalid id is ignored.
+        """
+        heartbeat = heartbeat or Config.SSE_HEARTBEAT
+        self._ensure_started()
+        q = queue.Queue(maxsize=self.queue_size)
+        with self.lock:
+            self.subscribers.add(q)
+        try:
+            last_sent = (0, 0)
+            if last_event_id and valid_event_id(last_event_id):
+                last_sent = _id_tuple(last_event_id)
+                for event_id, fields in self.redis.xrange(self.stream, min=f"({last_event_id}", max="+", count=self.queue_size):
+                    last_sent = _id_tuple(event_id)
+                    yield event_id, fields
+
+            while True:
+                try:
+                    event = q.get(timeout=heartbeat)
+                except queue.Empty:
+                    yield None
+                    continue
+                if event is None:
+                    return  # dropped as a slow consumer
+                if _id_tuple(event[0]) <= last_sent:
+                    continue  # already sent during the backfill
+                last_sent = _id_tuple(event[0])
+                yield event
+        finally:
+            self.unsubscribe(q)
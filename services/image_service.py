@@ -1,4 +1,7 @@
+import base64
+
 from clients.openrouter_client import OpenRouterClient
+from config import Config
 
 class ImageService:
     def __init__(self):
@@ -7,3 +10,16 @@ class ImageService:
     def generate(self, title, image_prompt):
         prompt = f"Photographic image for article titled: {title}. {image_prompt}, realistic."
         return self.client.generate_image(prompt)
+
+    def to_bytes(self, image_data):
+        """Image bytes from a generate() response ({"data": [{"b64_json": ...} | {"url": ...}]})"""
+        if isinstance(image_data, (bytes, bytearray)):
+            return bytes(image_data)
+        item = (image_data.get("data") or [{}])[0]
+        if item.get("b64_json"):
+            return base64.b64decode(item["b64_json"])
+        if item.get("url"):
+            res = self.client.http.get(item["url"], timeout=Config.TIMEOUT)
+            res.raise_for_status()
+            return res.content
+        raise ValueError("No image in generation response")
@@ -15,9 +15,10 @@ class ProductBuilder:
         tone="informative", audience="general", max_tokens=1200
     ):
         tags_str = ",".join(tags or [])
+        today = datetime.date.today().isoformat()
         prompt = f"""
         You are an expert content writer and SEO specialist for a WooCommerce eyewear store. 
-        Today's date is {datetime.date.today().isoformat()}.
+        Today's date is {today}.
 
         Input:
         - Product title: {title}
@@ -44,7 +45,8 @@ class ProductBuilder:
         "hashtags": "comma,separated"
         }}
         """
-        res = self.client.chat([{"role": "user", "content": prompt}], max_tokens=max_tokens)
+        # the date only nudges the model towards current trends, don't let it split the cache
+        res = self.client.chat([{"role": "user", "content": prompt}], max_tokens=max_tokens, volatile=[today])
         content = res["choices"][0]["message"]["content"]
 
         try:
@@ -0,0 +1,171 @@
+import codecs
+import csv
+import json
+import uuid
+
+from config import Config
+from utils.helpers import log
+from utils.normalizer import normalize_prices
+
+FORMATS = ("csv", "ndjson")
+NDJSON_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl", "application/json-lines")
+CSV_TYPES = ("text/csv", "application/csv")
+
+# Same job fields as /products/publish_product, plus stock
+TEXT_FIELDS = ("title", "category", "brand", "keywords", "tone", "audience")
+LIST_FIELDS = ("tags", "images")
+NUMERIC_FIELDS = ("price", "sale_price", "stock_quantity")
+DEFAULTS = {"category": "Uncategorized", "keywords": "", "tone": "informative", "audience": "general"}
+
+
+def detect_format(mimetype, filename=None, requested=None):
+    """csv / ndjson from an explicit ?format=, the content type or the file extension"""
+    if requested:
+        return requested if requested in FORMATS else None
+    name = (filename or "").lower()
+    if mimetype in NDJSON_TYPES or name.endswith((".ndjson", ".jsonl")):
+        return "ndjson"
+    if mimetype in CSV_TYPES or name.endswith(".csv"):
+        return "csv"
+    return None
+
+
+def iter_lines(stream, chunk_size=64 * 1024):
+    """Decode a binary stream chunk by chunk and yield lines (newline kept), never the whole body"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    pending = ""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line + "\n"
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+def _csv_rows(stream):
+    reader = csv.DictReader(iter_lines(stream))
+    row_number = 0
+    while True:
+        row_number += 1
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            yield row_number, None, f"invalid CSV: {e}"
+            continue
+        # extra cells beyond the header end up under the None key
+        yield row_number, {k.strip(): v for k, v in row.items() if k is not None}, None
+
+
+def _ndjson_rows(stream):
+    for row_number, line in enumerate(iter_lines(stream), 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield row_number, None, f"invalid JSON: {e}"
+            continue
+        if not isinstance(row, dict):
+            yield row_number, None, "each line must be a JSON object"
+            continue
+        yield row_number, row, None
+
+
+def iter_rows(stream, fmt):
+    """Yield (row_number, row_dict, error) for every data row of a CSV or NDJSON stream"""
+    return _csv_rows(stream) if fmt == "csv" else _ndjson_rows(stream)
+
+
+def _text(value):
+    return "" if value is None else str(value).strip()
+
+
+def _list(value):
+    items = value if isinstance(value, list) else _text(value).split(",")
+    return ",".join(s for s in (_text(v) for v in items) if s)
+
+
+class ProductIngest:
+    """
+    Validates uploaded product rows and queues them as product jobs.
+
+    Rows are handled in chunks: each chunk's price and stock columns are
+    normalized in one pass, and the valid rows are published with pipelined
+    XADDs. Every job carries the batch id; the result lists each row as
+    accepted (with its job id) or rejected (with the reason).
+    """
+
+    def __init__(self, broker, chunk_size=None):
+        self.broker = broker
+        self.chunk_size = chunk_size or Config.BULK_INGEST_CHUNK
+        self.batch_id = uuid.uuid4().hex
+        self.results = []
+        self.accepted = 0
+
+    def _validate(self, chunk):
+        """Turn a chunk of (row_number, row) into job data, rejecting invalid rows; returns [(row_number, job)]"""
+        columns = {f: normalize_prices([row.get(f) if _text(row.get(f)) else None for _, row in chunk], default=None)
+                   for f in NUMERIC_FIELDS}
+        jobs = []
+        for i, (row_number, row) in enumerate(chunk):
+            price, sale_price, stock = (columns[f][i] for f in NUMERIC_FIELDS)
+            error = None
+            if not _text(row.get("title")):
+                error = "title is required"
+            elif price is None:
+                error = "price is missing or has no digits"
+            elif _text(row.get("sale_price")) and sale_price is None:
+                error = "sale_price has no digits"
+            elif sale_price is not None and sale_price >= price:
+                error = "sale_price must be lower than price"
+            elif _text(row.get("stock_quantity")) and stock is None:
+                error = "stock_quantity has no digits"
+            if error:
+                self.results.append({"row": row_number, "status": "rejected", "error": error})
+                continue
+
+            job = {f: _text(row.get(f)) or DEFAULTS.get(f) for f in TEXT_FIELDS}
+            job.update({f: _list(row.get(f)) for f in LIST_FIELDS})
+            job.update(price=price, sale_price=sale_price, stock_quantity=stock, batch_id=self.batch_id)
+            jobs.append((row_number, {k: v for k, v in job.items() if v is not None}))
+        return jobs
+
+    def _publish(self, chunk):
+        jobs = self._validate(chunk)
+        if not jobs:
+            return
+        job_ids = self.broker.publish_many([job for _, job in jobs], chunk_size=self.chunk_size)
+        for (row_number, _), job_id in zip(jobs, job_ids):
+            self.results.append({"row": row_number, "status": "accepted", "job_id": job_id.decode()})
+        self.accepted += len(job_ids)
+
+    def run(self, rows):
+        chunk = []
+        for row_number, row, error in rows:
+            if error:
+                self.results.append({"row": row_number, "status": "rejected", "error": error})
+                continue
+            chunk.append((row_number, row))
+            if len(chunk) >= self.chunk_size:
+                self._publish(chunk)
+                chunk = []
+        if chunk:
+            self._publish(chunk)
+
+        self.results.sort(key=lambda r: r["row"])
+        rejected = len(self.results) - self.accepted
+        log(f"[ProductIngest] Batch {self.batch_id}: {self.accepted} queued, {rejected} rejected")
+        return {
+            "batch_id": self.batch_id,
+            "accepted": self.accepted,
+            "rejected": rejected,
+            "results": self.results,
+        }
@@ -1,4 +1,5 @@
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, Response, render_template, jsonify, request, stream_with_context
+import json
 import os
 import sys
 
@@ -7,6 +8,9 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from services.blueprints.article import article_bp
 from services.blueprints.product import product_bp
 from messaging.redis_broker import RedisBroker
+from messaging.job_index import STATUSES
+from messaging.stream_retention import StreamRetention
+from services.event_hub import EventHub, valid_event_id
 
 app = Flask(__name__, template_folder=os.path.join(os.path.dirname(__file__), "templates"))
 
@@ -17,6 +21,10 @@ app.register_blueprint(product_bp, url_prefix="/products")
 article_broker = RedisBroker(stream="article_jobs")
 product_broker = RedisBroker(stream="product_jobs")
 
+# One Redis subscription shared by every dashboard connection
+event_hub = EventHub()
+JOB_TYPES = {"article_jobs": "article", "product_jobs": "product"}
+
 @app.route("/")
 def dashboard():
     return render_template("dashboard_advanced.html")
@@ -37,10 +45,66 @@ def get_jobs(job_type):
         })
     return jsonify(jobs)
 
+@app.route("/api/jobs/<job_type>/list", methods=["GET"])
+def list_jobs(job_type):
+    """
+    Cursor-paginated listing from the job index, newest first.
+    ?status=queued|running|done|failed  ?cursor=<next_cursor>  ?limit=1..100
+    """
+    broker = article_broker if job_type == "article" else product_broker
+    status = request.args.get("status") or None
+    if status and status not in STATUSES:
+        return jsonify({"error": f"status must be one of {', '.join(STATUSES)}"}), 400
+    cursor = request.args.get("cursor", type=int)
+    limit = max(1, min(request.args.get("limit", 20, type=int), 100))
+
+    jobs, next_cursor = broker.index.list(status=status, cursor=cursor, limit=limit)
+    return jsonify({"jobs": jobs, "next_cursor": next_cursor})
+
+@app.route("/api/jobs/<job_type>/counts", methods=["GET"])
+def job_counts(job_type):
+    broker = article_broker if job_type == "article" else product_broker
+    return jsonify(broker.index.counts())
+
+@app.route("/api/jobs/<job_type>/stream", methods=["GET"])
+def stream_stats(job_type):
+    """Length, memory usage and archive state of the job stream"""
+    broker = article_broker if job_type == "article" else product_broker
+    return jsonify(StreamRetention(broker.redis, broker.stream).stats())
+
+@app.route("/api/events", methods=["GET"])
+def job_events():
+    """
+    Server-Sent Events feed of job status changes. Browsers resume from the
+    Last-Event-ID header on reconnect; ?last_event_id= works for manual clients
+    and ?job_type=article|product filters the feed.
+    """
+    last_event_id = request.headers.get("Last-Event-ID") or request.args.get("last_event_id")
+    job_type = request.args.get("job_type")
+    if last_event_id and not valid_event_id(last_event_id):
+        return jsonify({"error": "last_event_id must be a stream id like 1700000000000-0"}), 400
+
+    def stream():
+        yield "retry: 3000\n\n"
+        for event in event_hub.listen(last_event_id):
+            if event is None:
+                yield ": keepalive\n\n"
+                continue
+            event_id, fields = event
+            data = dict(fields)
+            data["job_type"] = JOB_TYPES.get(data.pop("stream", ""), "")
+            if job_type and data["job_type"] != job_type:
+                continue
+            yield f"id: {event_id}\nevent: job\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_with_context(stream()), mimetype="text/event-stream", headers=headers)
+
 @app.route("/api/jobs/<job_type>/delete/<job_id>", methods=["POST"])
 def delete_job(job_type, job_id):
     broker = article_broker if job_type == "article" else product_broker
     broker.redis.xdel(broker.stream, job_id)
+    broker.index.remove(job_id)
     return jsonify({"status": "deleted", "job_id": job_id})
 
 @app.route("/api/jobs/<job_type>/requeue/<job_id>", methods=["POST"])
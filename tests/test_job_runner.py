@@ -0,0 +1,86 @@
+import threading
+import time
+
+from config import Config
+from messaging.job_runner import JobRunner, RetryLater
+
+
+class FakeReader:
+    def read(self, count=1):
+        return []
+
+    def log_stats(self):
+        pass
+
+
+class FakeBroker:
+    """Just enough of a consumer group: a PEL with per-message idle times"""
+
+    stream = "jobs"
+
+    def __init__(self):
+        self.pending = {}  # msg_id -> (fields, last delivery)
+        self.lock = threading.Lock()
+
+    def consumer(self, group, name, block=5000):
+        return FakeReader()
+
+    def deliver(self, msg_id, fields):
+        self.pending[msg_id] = (fields, time.monotonic())
+
+    def touch(self, group, consumer, msg_ids):
+        with self.lock:
+            for msg_id in msg_ids:
+                if msg_id in self.pending:
+                    self.pending[msg_id] = (self.pending[msg_id][0], time.monotonic())
+
+    def prune_consumers(self, group, min_idle_ms, keep=None):
+        return []
+
+    def claim_stale(self, group, consumer, min_idle_ms, count=10):
+        claimed = []
+        with self.lock:
+            for msg_id, (fields, delivered) in self.pending.items():
+                if (time.monotonic() - delivered) * 1000 >= min_idle_ms and len(claimed) < count:
+                    self.pending[msg_id] = (fields, time.monotonic())
+                    claimed.append((msg_id, fields))
+        return claimed
+
+    def ack(self, msg_id):
+        with self.lock:
+            self.pending.pop(msg_id, None)
+
+
+def test_deferred_job_is_not_reclaimed_while_it_waits(monkeypatch):
+    monkeypatch.setattr(Config, "RECLAIM_MIN_IDLE", 0.2)
+    monkeypatch.setattr(Config, "RECLAIM_INTERVAL", 0.05)
+    broker = FakeBroker()
+    outage_until = time.monotonic() + 1.0  # five times RECLAIM_MIN_IDLE
+    runs, calls = [], []
+
+    def handler(msg_id, fields):
+        calls.append(msg_id)
+        if time.monotonic() < outage_until:
+            raise RetryLater(0.07)
+        runs.append(msg_id)
+        broker.ack(msg_id)
+
+    runner = JobRunner(broker, "group", "test", handler, concurrency=2, prefetch=2, reclaim=True)
+    broker.deliver("1-0", {"title": "a"})
+    runner.submit("1-0", {"title": "a"})
+
+    most_deferred = 0
+    deadline = time.monotonic() + 3
+    while not runs and time.monotonic() < deadline:
+        runner.submit_due()
+        runner.reclaim_stale()
+        with runner.cond:
+            most_deferred = max(most_deferred, len(runner.deferred))
+        time.sleep(0.01)
+    time.sleep(0.2)
+    runner.pool.shutdown(wait=True)
+
+    assert runs == ["1-0"]
+    assert most_deferred == 1
+    assert len(calls) <= 16  # re-checked every 0.07s, never duplicated
+    assert not broker.pending
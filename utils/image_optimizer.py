@@ -0,0 +1,194 @@
+import io
+import mimetypes
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from config import Config
+from utils.helpers import log
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # image optimization is optional
+    Image = None
+
+MIME_BY_FORMAT = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp", "GIF": "image/gif"}
+EXT_BY_FORMAT = {"JPEG": ".jpg", "PNG": ".png", "WEBP": ".webp", "GIF": ".gif"}
+
+
+def sniff_mime(head, filename=None):
+    """MIME type from the first bytes of an image, falling back to the file name"""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG"):
+        return "image/png"
+    if head.startswith(b"GIF8"):
+        return "image/gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return mimetypes.guess_type(filename or "")[0] or "application/octet-stream"
+
+
+def _optimize(source, max_size, quality, target, dest=None):
+    """
+    Runs in the process pool. `source` is image bytes or a path; the result is
+    written to `dest` when given, else returned. Returns (bytes or None, format,
+    new byte size, original dimensions, new dimensions), or None when the image
+    should be uploaded as it is.
+    """
+    img = Image.open(io.BytesIO(source) if isinstance(source, bytes) else source)
+    if getattr(img, "is_animated", False):
+        return None
+    source_format = img.format
+    original_dims = img.size
+    img = ImageOps.exif_transpose(img)  # bake the orientation in before EXIF is dropped
+    img.thumbnail((max_size, max_size), Image.LANCZOS)
+
+    fmt = source_format if target == "keep" else target.upper()
+    has_alpha = img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info
+    if fmt == "JPEG" and has_alpha:
+        fmt = "PNG" if source_format == "PNG" else "WEBP"
+    if fmt not in MIME_BY_FORMAT or fmt == "GIF":
+        fmt = "WEBP"
+    if fmt == "JPEG" and img.mode != "RGB":
+        img = img.convert("RGB")
+
+    # No exif= argument, so metadata is not written; the colour profile is kept
+    options = {"icc_profile": img.info["icc_profile"]} if img.info.get("icc_profile") else {}
+    if fmt == "JPEG":
+        options.update(quality=quality, optimize=True, progressive=True)
+    elif fmt == "WEBP":
+        options.update(quality=quality, method=4)
+    else:
+        options.update(optimize=True)
+
+    out = dest or io.BytesIO()
+    img.save(out, fmt, **options)
+    if dest:
+        return None, fmt, os.path.getsize(dest), original_dims, img.size
+    return out.getvalue(), fmt, out.tell(), original_dims, img.size
+
+
+class ImageOptimizer:
+    """
+    Resizes, strips metadata and recompresses images before they are uploaded.
+
+    Pillow work runs in a small process pool, so uploads on the worker's
+    threads keep going while an image is being encoded. Its processes are
+    spawned rather than forked, since the pool is created from a worker thread
+    of an already multithreaded process. Images whose result would be larger
+    than the original are uploaded unchanged.
+    """
+
+    def __init__(self, max_size=None, quality=None, target=None, workers=None):
+        self.max_size = max_size or Config.IMAGE_MAX_SIZE
+        self.quality = quality or Config.IMAGE_QUALITY
+        self.target = (target or Config.IMAGE_FORMAT).lower()
+        self.pool = ProcessPoolExecutor(
+            max_workers=workers or Config.IMAGE_OPTIMIZE_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+        self.lock = threading.Lock()
+        self.images = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def _run(self, source, filename, dest=None):
+        try:
+            return self.pool.submit(_optimize, source, self.max_size, self.quality, self.target, dest).result()
+        except Exception as e:
+            log(f"[ImageOptimizer] {filename}: not optimized ({e})")
+            return None
+
+    def optimize_bytes(self, data, filename="image.jpg"):
+        """Returns (data, filename, mime type)"""
+        result = self._run(data, filename)
+        if result is None or result[2] >= len(data):
+            self._record(filename, len(data), len(data))
+            return data, filename, sniff_mime(data[:16], filename)
+
+        optimized, fmt, size, before, after = result
+        self._record(filename, len(data), size, before, after)
+        return optimized, os.path.splitext(filename)[0] + EXT_BY_FORMAT[fmt], MIME_BY_FORMAT[fmt]
+
+    def optimize_file(self, path, dest, filename):
+        """Write the optimized image to `dest`; returns (filename, mime type), or None to upload `path` unchanged"""
+        original = os.path.getsize(path)
+        result = self._run(path, filename, dest)
+        if result is None or result[2] >= original:
+            self._record(filename, original, original)
+            return None
+
+        _, fmt, size, before, after = result
+        self._record(filename, original, size, before, after)
+        return os.path.splitext(filename)[0] + EXT_BY_FORMAT[fmt], MIME_BY_FORMAT[fmt]
+
+    def _record(self, filename, size_in, size_out, before=None, after=None):
+        with self.lock:
+            self.images += 1
+            self.bytes_in += size_in
+            self.bytes_out += size_out
+        saved = size_in - size_out
+        dims = f", {before[0]}x{before[1]} -> {after[0]}x{after[1]}" if before else ""
+        log(f"[ImageOptimizer] {filename}: {size_in / 1024:.0f} KiB -> {size_out / 1024:.0f} KiB, saved {saved / 1024:.0f} KiB ({saved / max(size_in, 1):.0%}){dims}")
+
+    def log_stats(self):
+        saved = self.bytes_in - self.bytes_out
+        log(f"[ImageOptimizer] {self.images} images | {self.bytes_in / 1048576:.1f} MiB -> {self.bytes_out / 1048576:.1f} MiB, saved {saved / 1048576:.1f} MiB")
+
+
+_optimizer = None
+_optimizer_lock = threading.Lock()
+_unavailable = False  # IMAGE_OPTIMIZE is set but Pillow is missing; warned once
+
+
+def get_image_optimizer():
+    """The process-wide optimizer, or None when IMAGE_OPTIMIZE is off or Pillow is missing"""
+    global _optimizer, _unavailable
+    if not Config.IMAGE_OPTIMIZE or _unavailable:
+        return None
+    if Image is None:
+        log("[ImageOptimizer] IMAGE_OPTIMIZE is set but Pillow is not installed; uploading images unchanged")
+        _unavailable = True
+        return None
+    with _optimizer_lock:
+        if _optimizer is None:
+            _optimizer = ImageOptimizer()
+        return _optimizer
+
+
+def prepare_bytes(data, filename):
+    """Image bytes ready for upload: (data, filename, mime type), optimized when enabled"""
+    optimizer = get_image_optimizer()
+    if optimizer is None:
+        return data, filename, sniff_mime(data[:16], filename)
+    return optimizer.optimize_bytes(data, filename)
+
+
+@contextmanager
+def prepare_file(path, filename=None):
+    """
+    Yields (path, filename, mime type) of the file to upload. With optimization on,
+    that is a temporary file holding the optimized image, removed afterwards.
+    """
+    filename = filename or os.path.basename(path)
+    optimizer = get_image_optimizer()
+    optimized = None
+    if optimizer is not None:
+        fd, tmp = tempfile.mkstemp(suffix=".img")
+        os.close(fd)
+        optimized = optimizer.optimize_file(path, tmp, filename)
+        if optimized is None:
+            os.remove(tmp)
+
+    if optimized is None:
+        with open(path, "rb") as f:
+            head = f.read(16)
+        yield path, filename, sniff_mime(head, filename)
+        return
+    try:
+        yield (tmp, *optimized)
+    finally:
+        os.remove(tmp)
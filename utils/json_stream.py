@@ -0,0 +1,138 @@
+import json
+
+
+class IncrementalJSONParser:
+    """
+    Incremental parser for a JSON object arriving in chunks (e.g. a streamed LLM reply).
+
+    feed() returns the top-level fields completed by the new text as (key, value)
+    pairs. Arrays listed in `stream_keys` are not buffered whole: each element is
+    returned as (f"{key}[]", element) as soon as it closes. Anything before the
+    first "{" (```json fences, preambles) and after the closing "}" is ignored.
+    Only the value currently being read is kept in memory.
+    """
+
+    def __init__(self, stream_keys=("chapters",)):
+        self.stream_keys = set(stream_keys)
+        self.buf = ""
+        self.pos = 0
+        self.started = False
+        self.done = False
+        self.depth = 0
+        self.in_str = False
+        self.esc = False
+        self.expect = "key"  # key | colon | value | scalar | comma
+        self.key = None
+        self.key_start = None
+        self.cap_start = None
+        self.cap_kind = None  # string | scalar | container | stream
+        self.item_start = None
+
+    def _emit_item(self, events, end):
+        events.append((f"{self.key}[]", json.loads(self.buf[self.item_start:end].strip())))
+        self.item_start = None
+
+    def _string_closed(self, i, events):
+        if self.depth == 1 and self.expect == "key":
+            self.key = json.loads(self.buf[self.key_start:i + 1])
+            self.key_start = None
+            self.expect = "colon"
+        elif self.depth == 1 and self.cap_kind == "string":
+            events.append((self.key, json.loads(self.buf[self.cap_start:i + 1])))
+            self.cap_start = None
+            self.expect = "comma"
+        elif self.depth == 2 and self.cap_kind == "stream" and self.item_start is not None and self.buf[self.item_start] == '"':
+            self._emit_item(events, i + 1)
+
+    def feed(self, text):
+        events = []
+        self.buf += text
+        i = self.pos
+        while i < len(self.buf) and not self.done:
+            c = self.buf[i]
+
+            if not self.started:
+                if c == "{":
+                    self.started = True
+                    self.depth = 1
+            elif self.in_str:
+                if self.esc:
+                    self.esc = False
+                elif c == "\\":
+                    self.esc = True
+                elif c == '"':
+                    self.in_str = False
+                    self._string_closed(i, events)
+            elif self.depth == 1:
+                if self.expect == "key":
+                    if c == '"':
+                        self.in_str = True
+                        self.key_start = i
+                    elif c == "}":
+                        self.done = True
+                elif self.expect == "colon":
+                    if c == ":":
+                        self.expect = "value"
+                elif self.expect == "value":
+                    if not c.isspace():
+                        self.cap_start = i
+                        if c == '"':
+                            self.in_str = True
+                            self.cap_kind = "string"
+                        elif c in "{[":
+                            self.depth += 1
+                            self.cap_kind = "stream" if c == "[" and self.key in self.stream_keys else "container"
+                            if self.cap_kind == "stream":
+                                self.cap_start = None  # elements are emitted one by one, don't keep the array
+                        else:
+                            self.cap_kind = "scalar"
+                            self.expect = "scalar"
+                elif self.expect == "scalar":
+                    if c in ",}":
+                        events.append((self.key, json.loads(self.buf[self.cap_start:i].strip())))
+                        self.cap_start = None
+                        self.expect = "key"
+                        self.done = c == "}"
+                elif self.expect == "comma":
+                    if c == ",":
+                        self.expect = "key"
+                    elif c == "}":
+                        self.done = True
+            else:
+                streaming = self.cap_kind == "stream" and self.depth == 2
+                if c == '"':
+                    self.in_str = True
+                    if streaming and self.item_start is None:
+                        self.item_start = i
+                elif c in "{[":
+                    if streaming and self.item_start is None:
+                        self.item_start = i
+                    self.depth += 1
+                elif c in "}]":
+                    self.depth -= 1
+                    if self.depth == 1:
+                        if self.cap_kind == "container":
+                            events.append((self.key, json.loads(self.buf[self.cap_start:i + 1])))
+                        elif self.item_start is not None:
+                            self._emit_item(events, i)
+                        self.cap_start = None
+                        self.expect = "comma"
+                    elif self.depth == 2 and self.cap_kind == "stream" and self.item_start is not None:
+                        self._emit_item(events, i + 1)
+                elif streaming:
+                    if c == ",":
+                        if self.item_start is not None:
+                            self._emit_item(events, i)
+                    elif not c.isspace() and self.item_start is None:
+                        self.item_start = i
+            i += 1
+
+        # drop everything that is no longer needed
+        starts = [s for s in (self.key_start, self.cap_start, self.item_start) if s is not None]
+        cut = min(starts) if starts else i
+        self.buf = self.buf[cut:]
+        self.pos = i - cut
+        for name in ("key_start", "cap_start", "item_start"):
+            if getattr(self, name) is not None:
+                setattr(self, name, getattr(self, name) - cut)
+        return events
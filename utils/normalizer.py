@@ -21,3 +21,15 @@ def normalize_price(value: str) -> int:
     # remove str,...
     value = re.sub(r"[^\d]", "", value)
     return int(value) if value else 0
+
+# Single-pass versions for bulk input
+_digit_table = str.maketrans(digit_map)
+_non_digits = re.compile(r"[^\d]")
+
+def normalize_prices(values, default=0) -> list:
+    """ normalize_price over many values; `default` for values without any digit """
+    result = []
+    for value in values:
+        value = _non_digits.sub("", str(value).translate(_digit_table)) if value is not None else ""
+        result.append(int(value) if value else default)
+    return result
@@ -1,10 +1,20 @@
 # authomatical\workers\article_worker.py
+import json
 import logging
 from messaging.redis_broker import RedisBroker
+from messaging.job_runner import JobRunner, RetryLater
+from messaging.stream_retention import StreamRetention
+from clients.http_transport import get_transport
+from clients.llm_cache import get_llm_cache
+from clients.llm_router import get_llm_router
 from services.article_builder import ArticleBuilder
 from services.image_service import ImageService
 from modules.wordpress_article import WordPressArticleModule
 from modules.wordpress_steps import WordPressSteps
+from modules.step_engine import Step, StepEngine, StepFailed
+from clients.retry_policy import CircuitOpenError
+from utils.image_optimizer import get_image_optimizer
+from config import Config
 
 logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(message)s')
 
@@ -15,105 +25,191 @@ image_service = ImageService()
 wp_module = WordPressArticleModule()
 
 GROUP = "article_jobs_group"
-CONSUMER = "article_worker_1"
+CONSUMER_PREFIX = "article_worker"
 
 logging.info("Article Worker started. Waiting for jobs...")
 
 
+# -------- CHECKPOINTS --------
+# article_temp:{msg_id} holds the generated article, the small outputs of finished
+# steps (post_id, media_id, ...) and one "step:<name>" field per finished step,
+# so a reclaimed job resumes after its last completed step.
+CHECKPOINT_SKIP = {"article", "content_html", "image_data"}  # article is written by STORE_TEMP, the rest is cheap to rebuild
+
+
+def temp_key(msg_id):
+    return f"article_temp:{msg_id.decode() if isinstance(msg_id, bytes) else msg_id}"
+
+
 def store_temp_article(msg_id, article_data):
-    broker.redis.hset(f"article_temp:{msg_id}", mapping={k: str(v) for k, v in article_data.items()})
+    key = temp_key(msg_id)
+    pipe = broker.redis.pipeline(transaction=False)
+    pipe.hset(key, "article", json.dumps(article_data, ensure_ascii=False))
+    pipe.expire(key, Config.ARTICLE_CHECKPOINT_TTL)
+    pipe.execute()
+
+
+def save_step(msg_id, step, outputs):
+    key = temp_key(msg_id)
+    mapping = {f"step:{step.label}": 1}
+    for k, v in outputs.items():
+        if k not in CHECKPOINT_SKIP:
+            mapping[k] = json.dumps(v)
+    pipe = broker.redis.pipeline(transaction=False)
+    pipe.hset(key, mapping=mapping)
+    pipe.expire(key, Config.ARTICLE_CHECKPOINT_TTL)
+    pipe.execute()
+
+
+def load_checkpoint(msg_id):
+    """Return (restored context, completed step labels) for a job, empty for new jobs"""
+    raw = broker.redis.hgetall(temp_key(msg_id))
+    restored, completed = {}, set()
+    for k, v in raw.items():
+        k = k.decode()
+        if k.startswith("step:"):
+            completed.add(k[5:])
+        else:
+            restored[k] = json.loads(v)
+    return restored, completed
+
+
+def trim_temp_article(msg_id):
+    """Drop the heavy artifact, keep the step cursor until the job is acked"""
+    broker.redis.hdel(temp_key(msg_id), "article", "content_html")
 
 
 def delete_temp_article(msg_id):
-    broker.redis.delete(f"article_temp:{msg_id}")
+    broker.redis.delete(temp_key(msg_id))
+
+
+# -------- STEPS --------
+def build_article(ctx):
+    fields = ctx["fields"]
+    keywords = fields.get("keywords", "No Keywords")
+    chapters = int(fields.get("chapters", 5))
+    tone = fields.get("tone", "informative")
+    audience = fields.get("audience", "general")
+    max_tokens = int(fields.get("max_words", 500)) * chapters
+
+    article = article_builder.build_structure(
+        keywords=keywords,
+        num_chapters=chapters,
+        tone=tone,
+        audience=audience,
+        max_tokens=max_tokens
+    )
+    return {"article": article}
+
+
+def store_temp(ctx):
+    store_temp_article(ctx["msg_id"], ctx["article"])
+    return {"stored": True}
+
+
+def generate_image(ctx):
+    article = ctx["article"]
+    image_data = image_service.generate(article.get("title", ""), article.get("imagePrompt", ""))
+    return {"image_data": image_service.to_bytes(image_data)}
+
+
+def combine_html(ctx):
+    article = ctx["article"]
+
+    content_html = article.get("introduction", "") + "\n"
+
+    for chapter in article.get("chapters", []):
+        title = chapter.get("title") or chapter.get("chapterTitle") or ""
+        content = chapter.get("content", "")
+        content_html += f"{title}\n{content}\n"
+
+    content_html += "\n" + article.get("conclusions", "")
+    return {"content_html": content_html}
+
+
+def create_post(ctx):
+    article = ctx["article"]
+    post_id = wp_module.create_post(article.get("title", "Untitled"), ctx["content_html"], status="publish")
+    return {"post_id": post_id}
+
+
+def upload_media(ctx):
+    media_id = wp_module.upload_media(ctx["post_id"], ctx["image_data"], filename="featured.jpg")
+    return {"media_id": media_id}
+
+
+def cleanup(ctx):
+    trim_temp_article(ctx["msg_id"])
+    return {"cleaned": True}
+
+
+def acknowledge(ctx):
+    broker.set_status(ctx["msg_id"], "done", post_id=ctx.get("post_id"))
+    # sent right away: once the checkpoint is gone, a lost ack would publish the post twice
+    broker.ack(GROUP, ctx["msg_id"], wait=True)
+    delete_temp_article(ctx["msg_id"])
+    logging.info(f"[{ctx['msg_id']}] ✅ Completed successfully")
+    return {}
+
+
+S = WordPressSteps
+ARTICLE_STEPS = [
+    Step(S.BUILD_ARTICLE, build_article, inputs=["fields"], outputs=["article"]),
+    Step(S.STORE_TEMP, store_temp, inputs=["article"], outputs=["stored"]),
+    # image generation runs alongside COMBINE_HTML / CREATE_POST, upload only waits on the post id
+    Step(S.GENERATE_IMAGE, generate_image, inputs=["article"], outputs=["image_data"], optional=True, enabled=Config.ARTICLE_IMAGES),
+    Step(S.COMBINE_HTML, combine_html, inputs=["article"], outputs=["content_html"]),
+    Step(S.CREATE_POST, create_post, inputs=["article", "content_html"], outputs=["post_id"]),
+    Step(S.UPLOAD_MEDIA, upload_media, inputs=["post_id", "image_data"], outputs=["media_id"], optional=True, enabled=Config.ARTICLE_IMAGES),
+    Step(S.CLEANUP, cleanup, inputs=["post_id", "stored"], outputs=["cleaned"]),
+    Step(S.ACKNOWLEDGE, acknowledge, inputs=["cleaned"], after=[S.UPLOAD_MEDIA]),
+]
+engine = StepEngine(ARTICLE_STEPS)
 
 
 def process_chain(msg_id, fields):
     """Pipeline execution for article processing"""
-    context = {"fields": fields}
-
-    for step in [
-        WordPressSteps.BUILD_ARTICLE,
-        WordPressSteps.STORE_TEMP,
-        # WordPressSteps.GENERATE_IMAGE,   # optional
-        WordPressSteps.COMBINE_HTML,
-        WordPressSteps.CREATE_POST,
-        # WordPressSteps.UPLOAD_MEDIA,    # optional
-        WordPressSteps.CLEANUP,
-        WordPressSteps.ACKNOWLEDGE,
-    ]:
-        try:
-            logging.info(f"[{msg_id}] Running step: {step.value}")
-
-            if step == WordPressSteps.BUILD_ARTICLE:
-                keywords = fields.get("keywords", "No Keywords")
-                chapters = int(fields.get("chapters", 5))
-                tone = fields.get("tone", "informative")
-                audience = fields.get("audience", "general")
-                max_tokens = int(fields.get("max_words", 500)) * chapters
-
-                article = article_builder.build_structure(
-                    keywords=keywords,
-                    num_chapters=chapters,
-                    tone=tone,
-                    audience=audience,
-                    max_tokens=max_tokens
-                )
-                context["article"] = article
-
-            elif step == WordPressSteps.STORE_TEMP:
-                store_temp_article(msg_id, context["article"])
-
-            elif step == WordPressSteps.GENERATE_IMAGE:
-                try:
-                    article = context["article"]
-                    image_data = image_service.generate(article.get("title", ""), article.get("imagePrompt", ""))
-                    context["image_data"] = image_data
-                except Exception as e:
-                    logging.warning(f"[{msg_id}] Image generation failed: {e}")
-
-            elif step == WordPressSteps.COMBINE_HTML:
-                article = context["article"]
-
-                content_html = article.get("introduction", "") + "\n"
-
-                for chapter in article.get("chapters", []):
-                    title = chapter.get("title") or chapter.get("chapterTitle") or ""
-                    content = chapter.get("content", "")
-                    content_html += f"{title}\n{content}\n"
-
-                content_html += "\n" + article.get("conclusions", "")
-                context["content_html"] = content_html
-
-
-            elif step == WordPressSteps.CREATE_POST:
-                article = context["article"]
-                post_id = wp_module.create_post(article.get("title", "Untitled"), context["content_html"], status="publish")
-                context["post_id"] = post_id
-
-            elif step == WordPressSteps.UPLOAD_MEDIA:
-                if "image_data" in context:
-                    wp_module.upload_media(context["post_id"], context["image_data"], filename="featured.jpg")
-
-            elif step == WordPressSteps.CLEANUP:
-                delete_temp_article(msg_id)
-
-            elif step == WordPressSteps.ACKNOWLEDGE:
-                broker.ack(GROUP, msg_id)
-                logging.info(f"[{msg_id}] ✅ Completed successfully")
-
-        except Exception as e:
-            logging.error(f"[{msg_id}] ❌ Failed at step {step.value}: {e}")
-            broker.ack(GROUP, msg_id)  # Ack even on failure
-            break
-
-
-while True:
-    messages = broker.consume(GROUP, CONSUMER, block=5000, count=1)
-    if not messages:
-        continue
-
-    for stream_name, msgs in messages:
-        for msg_id, fields in msgs:
-            logging.info(f"Received job {msg_id}: {fields}")
-            process_chain(msg_id, fields)
\ No newline at end of file
+    context = {"msg_id": msg_id, "fields": fields}
+    broker.set_status(msg_id, "running")
+    try:
+        restored, completed = load_checkpoint(msg_id)
+        if completed:
+            logging.info(f"[{msg_id}] Resuming after steps: {sorted(completed)}")
+        context.update(restored)
+        engine.run(
+            context,
+            job_id=msg_id,
+            on_step_done=lambda step, outputs: save_step(msg_id, step, outputs),
+            completed=completed,
+        )
+    except StepFailed as e:
+        if isinstance(e.error, CircuitOpenError):
+            # WordPress is down: keep the message pending and the checkpoint, resume later
+            raise RetryLater(e.error.retry_in, str(e.error))
+        logging.error(f"[{msg_id}] ❌ {e}")
+        broker.set_status(msg_id, "failed", error=e)
+        broker.ack(GROUP, msg_id)  # Ack even on failure
+        delete_temp_article(msg_id)
+    except Exception as e:
+        logging.error(f"[{msg_id}] ❌ {e}")
+        broker.set_status(msg_id, "failed", error=e)
+        broker.ack(GROUP, msg_id)  # Ack even on failure
+        delete_temp_article(msg_id)
+
+
+def handle_job(msg_id, fields):
+    logging.info(f"Received job {msg_id}: {fields}")
+    process_chain(msg_id, fields)
+
+
+if __name__ == "__main__":
+    reporters = [get_transport().log_stats]
+    retention = StreamRetention(broker.redis, broker.stream)
+    reporters += [retention.run_if_due, retention.log_stats]
+    if get_llm_cache() is not None:
+        reporters.append(get_llm_cache().log_stats)
+    if get_llm_router() is not None:
+        reporters.append(get_llm_router().log_stats)
+    if get_image_optimizer() is not None:
+        reporters.append(get_image_optimizer().log_stats)
+    JobRunner(broker, GROUP, CONSUMER_PREFIX, handle_job, reporters=reporters, reclaim=True).run()
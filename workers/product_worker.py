@@ -1,9 +1,18 @@
 import logging
 import re
 from messaging.redis_broker import RedisBroker
+from messaging.job_runner import JobRunner, RetryLater
+from messaging.stream_retention import StreamRetention
+from clients.http_transport import get_transport
+from clients.llm_cache import get_llm_cache
+from clients.llm_router import get_llm_router
 from clients.openrouter_client import OpenRouterClient
+from clients.retry_policy import CircuitOpenError, get_breaker
 from modules.wordpress_product import WordPressProductModule
+from modules.product_batcher import ProductBatcher
 from services.product_builder import ProductBuilder
+from utils.image_optimizer import get_image_optimizer
+from config import Config
 
 logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(message)s')
 
@@ -13,7 +22,7 @@ wp_product = WordPressProductModule()
 product_builder = ProductBuilder()
 
 GROUP = "product_jobs_group"
-CONSUMER = "product_worker_1"
+CONSUMER_PREFIX = "product_worker"
 
 def clean_description(desc: str) -> str:
     """Remove code fences like ```html, ```, ~~~ from AI output."""
@@ -25,73 +34,147 @@ def clean_description(desc: str) -> str:
 
 logging.info("Product Worker started. Waiting for jobs...")
 
-while True:
-    messages = broker.consume(GROUP, CONSUMER, block=5000, count=1)
-    if not messages:
-        continue
-
-    for stream_name, msgs in messages:
-        for msg_id, fields in msgs:
-            fields = {
-                (k.decode() if isinstance(k, bytes) else k):
-                (v.decode() if isinstance(v, bytes) else v)
-                for k, v in fields.items()
-            }
-            logging.info(f"Received job {msg_id}: {fields}")
-    
-            try:
-                # 1. Manual fieldsre
-                title = fields["title"]
-                price = float(fields.get("price", 0))
-                sale_price = float(fields.get("sale_price", 0)) if fields.get("sale_price") else None
-                category = fields.get("category", "Uncategorized")
-                brand = fields.get("brand")
-                tags = fields.get("tags", "").split(",") if fields.get("tags") else []
-                images = fields.get("images", "").split(",") if fields.get("images") else []
-                stock_raw = fields.get("stock_quantity")
-                try:
-                    stock_quantity = int(stock_raw) if stock_raw not in (None, "", "None") else 0
-                except ValueError:
-                    stock_quantity = 0
-
-                # 2. Generate all AI data
-                ai_output = product_builder.generate_full_product(
-                    title=title,
-                    price=price,
-                    sale_price=sale_price,
-                    category=category,
-                    brand=brand,
-                    tags=tags
-                )
-
-                description = clean_description(ai_output.get("description", ""))
-                seo_meta = ai_output.get("seo", {})
-                hashtags = ai_output.get("hashtags", "")
-
-                # convert hashtags to tags
-                if hashtags:
-                    tags.extend([h.strip().lstrip("#") for h in hashtags.split(",") if h.strip()])
-
-                # 3. Product Creation in WordPress
-                product_id = wp_product.create_product(
-                    title=title,
-                    description=description,
-                    price=price,
-                    sale_price=sale_price,
-                    category=category,
-                    brand=brand,
-                    tags=tags,
-                    images=images,
-                    meta_title=seo_meta.get("title"),
-                    meta_description=seo_meta.get("description"),
-                    keywords=seo_meta.get("keywords"),
-                    stock_quantity=stock_quantity,
-                    upload_images=False
-                )
-
-                logging.info(f"✅ Created product: {title}, id={product_id}")
-                broker.ack(GROUP, msg_id)
-
-            except Exception as e:
-                logging.error(f"❌ Failed to process product job {msg_id}: {e}")
-                broker.ack(GROUP, msg_id)
+
+def prepare_product(fields):
+    """Turn a job's fields into create_product keyword arguments (AI text included)"""
+    # 1. Manual fieldsre
+    title = fields["title"]
+    price = float(fields.get("price", 0))
+    sale_price = float(fields.get("sale_price", 0)) if fields.get("sale_price") else None
+    category = fields.get("category", "Uncategorized")
+    brand = fields.get("brand")
+    tags = fields.get("tags", "").split(",") if fields.get("tags") else []
+    images = fields.get("images", "").split(",") if fields.get("images") else []
+    stock_raw = fields.get("stock_quantity")
+    try:
+        stock_quantity = int(stock_raw) if stock_raw not in (None, "", "None") else 0
+    except ValueError:
+        stock_quantity = 0
+
+    # 2. Generate all AI data
+    ai_output = product_builder.generate_full_product(
+        title=title,
+        price=price,
+        sale_price=sale_price,
+        category=category,
+        brand=brand,
+        tags=tags
+    )
+
+    description = clean_description(ai_output.get("description", ""))
+    brand = brand or ai_output.get("brand")  # jobs from the Telegram bot leave the brand to the AI
+    seo_meta = ai_output.get("seo", {})
+    hashtags = ai_output.get("hashtags", "")
+
+    # convert hashtags to tags
+    if hashtags:
+        tags.extend([h.strip().lstrip("#") for h in hashtags.split(",") if h.strip()])
+
+    return dict(
+        title=title,
+        description=description,
+        price=price,
+        sale_price=sale_price,
+        category=category,
+        brand=brand,
+        tags=tags,
+        images=images,
+        meta_title=seo_meta.get("title"),
+        meta_description=seo_meta.get("description"),
+        keywords=seo_meta.get("keywords"),
+        stock_quantity=stock_quantity,
+    )
+
+
+# Jobs that carry a chat_id get their outcome pushed to RESULT_STREAM for the Telegram bot
+RESULT_STREAM = "product_results"
+result_targets = {}  # msg_id -> job fields, for results reported by the batcher
+
+
+def publish_result(msg_id, fields, product=None, error=None):
+    if not fields or not fields.get("chat_id"):
+        return
+    result = {"job_id": msg_id, "chat_id": fields["chat_id"], "title": fields.get("title", "")}
+    if error:
+        result.update(status="failed", error=str(error)[:300])
+    else:
+        result.update(status="done", product_id=product.get("id") or "", permalink=product.get("permalink") or "")
+    try:
+        broker.redis.xadd(RESULT_STREAM, result, maxlen=Config.JOB_EVENTS_MAXLEN, approximate=True)
+    except Exception as e:
+        logging.error(f"Failed to publish result of {msg_id}: {e}")
+
+
+def on_batch_result(msg_id, product, error):
+    if error:
+        logging.error(f"❌ Failed to process product job {msg_id}: {error}")
+        broker.set_status(msg_id, "failed", error=error)
+    else:
+        logging.info(f"✅ Created product: {product.get('name')}, id={product.get('id')}")
+        broker.set_status(msg_id, "done", product_id=product.get("id"))
+    publish_result(msg_id, result_targets.pop(msg_id, None), product, error)
+    broker.ack(GROUP, msg_id)
+
+
+# msg_id -> product kwargs of jobs deferred while WooCommerce was down, so a retry
+# does not pay for the AI text again
+prepared = {}
+
+
+# Batching mode: collect prepared products and create them through /products/batch
+batcher = ProductBatcher(wp_product, on_batch_result) if Config.PRODUCT_BATCH_SIZE > 1 else None
+
+
+def handle_job(msg_id, fields):
+    logging.info(f"Received job {msg_id}: {fields}")
+    broker.set_status(msg_id, "running")
+
+    product_kwargs = None
+    try:
+        product_kwargs = prepared.pop(msg_id, None)
+        if product_kwargs is None:
+            get_breaker(Config.WORDPRESS_URL).check()  # don't generate text for a site that is down
+            product_kwargs = prepare_product(fields)
+
+        if batcher is not None:
+            if fields.get("chat_id"):
+                result_targets[msg_id] = fields
+            batcher.add(msg_id, product_kwargs)  # acked by on_batch_result once its batch is sent
+            return
+
+        # 3. Product Creation in WordPress
+        product = wp_product.create_product(**product_kwargs, upload_images=False)
+        product_id = product.get("id") if isinstance(product, dict) else product
+
+        logging.info(f"✅ Created product: {product_kwargs['title']}, id={product_id}")
+        broker.set_status(msg_id, "done", product_id=product_id)
+        publish_result(msg_id, fields, product if isinstance(product, dict) else {"id": product_id})
+        broker.ack(GROUP, msg_id)
+
+    except CircuitOpenError as e:
+        # WooCommerce is down: leave the job pending and work on other jobs meanwhile
+        if product_kwargs is not None:
+            prepared[msg_id] = product_kwargs
+        raise RetryLater(e.retry_in, str(e))
+    except Exception as e:
+        logging.error(f"❌ Failed to process product job {msg_id}: {e}")
+        broker.set_status(msg_id, "failed", error=e)
+        publish_result(msg_id, fields, error=e)
+        broker.ack(GROUP, msg_id)
+
+
+if __name__ == "__main__":
+    reporters = [get_transport().log_stats, wp_product.wp.log_cache_stats, wp_product.wp.media_registry.log_stats]
+    retention = StreamRetention(broker.redis, broker.stream)
+    reporters += [retention.run_if_due, retention.log_stats]
+    if get_llm_cache() is not None:
+        reporters.append(get_llm_cache().log_stats)
+    if get_llm_router() is not None:
+        reporters.append(get_llm_router().log_stats)
+    if get_image_optimizer() is not None:
+        reporters.append(get_image_optimizer().log_stats)
+    # Jobs of a restarted worker are reclaimed; batched ones may wait up to PRODUCT_BATCH_WAIT on top of the job itself
+    JobRunner(
+        broker, GROUP, CONSUMER_PREFIX, handle_job, reporters=reporters, reclaim=True,
+        min_idle=Config.RECLAIM_MIN_IDLE + Config.PRODUCT_BATCH_WAIT, held=batcher and batcher.msg_ids,
+    ).run()
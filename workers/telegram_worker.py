@@ -1,31 +1,33 @@
+import asyncio
+import functools
 import os
 import logging
-import requests
-import mimetypes
 import re
-from requests.auth import HTTPBasicAuth
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
 
+import redis
+import redis.asyncio as aioredis
 from telegram import Update
+from telegram.error import BadRequest, Forbidden
 from telegram.ext import CommandHandler, MessageHandler, filters, ContextTypes
-from services.product_builder import ProductBuilder
-from modules.wordpress_product import WordPressProductModule
 
 from config import Config
 from clients.telegram_client import TelegramClient
+from clients.telegram_state import ConversationBusy, ConversationStore
+from clients.wordpress_client import WordPressClient
 from messaging.redis_broker import RedisBroker
+from messaging.job_runner import consumer_name
 
 logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(message)s')
 
-UPLOAD_DIR = "uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
-
 article_broker = RedisBroker(stream="article_jobs")
 product_broker = RedisBroker(stream="product_jobs")
 wordpress_broker = RedisBroker(stream="wordpress_jobs")
 
-builder = ProductBuilder()
-wp_module = WordPressProductModule()
+wp_client = WordPressClient()
+conversations = ConversationStore()
 
 # --- Normalizer ---
 PERSIAN_DIGITS = "۰۱۲۳۴۵۶۷۸۹"
@@ -63,6 +65,13 @@ ARTICLE_STEPS = [
     ("keywords", "📝 موضوع مقاله رو وارد کن:"),
 ]
 
+# chain name -> steps; only the name is stored in the conversation state
+STEP_CHAINS = {
+    "wordpress": WORDPRESS_STEPS,
+    "product": PRODUCT_STEPS,
+    "article": ARTICLE_STEPS,
+}
+
 # --- Categories ---
 CATEGORIES = [
     ("اکسسوری", "accessories"),
@@ -81,18 +90,21 @@ CATEGORIES = [
 ]
 
 # -------- HELPERS --------
-def init_chain(context, step_name, steps):
+def init_chain(context, step_name):
     context.user_data.clear()
     context.user_data["step"] = step_name
     context.user_data["substep"] = 0
     context.user_data["data"] = {}
-    context.user_data["steps"] = steps
+    context.user_data["chain"] = step_name
+
+def current_steps(context):
+    return STEP_CHAINS[context.user_data["chain"]]
 
 def push_next_substep(context):
     context.user_data["substep"] += 1
 
 async def ask_current_question(update, context):
-    steps = context.user_data["steps"]
+    steps = current_steps(context)
     sub = context.user_data["substep"]
     if sub < len(steps):
         await update.message.reply_text(steps[sub][1])
@@ -107,12 +119,29 @@ async def show_main_menu(update: Update):
     )
     await update.message.reply_text(msg)
 
+def with_conversation(handler):
+    """
+    Run `handler` with the user's conversation state from Redis in
+    context.user_data, holding the user's lock so bot replicas take turns.
+    """
+    @functools.wraps(handler)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        try:
+            async with conversations.session(update.effective_user.id, context.user_data):
+                await handler(update, context)
+        except ConversationBusy:
+            await update.message.reply_text("⏳ پیام قبلی هنوز در حال پردازش است، لطفاً دوباره بفرست.")
+    return wrapper
+
 # -------- START --------
+@with_conversation
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data.clear()
+    await conversations.clear_images(update.effective_user.id)
     await show_main_menu(update)
 
 # -------- HANDLE TEXT --------
+@with_conversation
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text = update.message.text.strip()
 
@@ -149,37 +178,27 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # --- photo upload mode ---
     if context.user_data.get("step") == "awaiting_images":
         if text == "پایان":
+            await collect_images(update, context)
             data = context.user_data["data"]
 
-            # Generate text and brand with AI
-            ai_product = builder.generate_full_product(
-                title=data["title"],
-                price=data.get("price", 0),
-                sale_price=data.get("sale_price") or None,
-                category=data.get("category")
-            )
-            brand_name = ai_product.get("brand", "Generic")
-
-            # Build the product
-            product_data = {
+            # Description, SEO and brand are generated by the product worker; the link comes back via RESULT_STREAM
+            job_data = {
                 "title": data["title"],
-                "description": ai_product["description"],
                 "price": data.get("price", 0),
-                "sale_price": data.get("sale_price") or None,
                 "category": data.get("category"),
-                "brand": brand_name,
-                "tags": ai_product.get("hashtags", "").split(","),
-                "images": data.get("images", []),
-                "meta_title": ai_product["seo"]["title"],
-                "meta_description": ai_product["seo"]["description"],
-                "keywords": ai_product["seo"]["keywords"],
+                "tags": "",
+                "images": ",".join(data.get("images", [])),
                 "stock_quantity": data.get("stock_quantity", 0),
+                "chat_id": update.effective_chat.id,
             }
+            if data.get("sale_price"):
+                job_data["sale_price"] = data["sale_price"]
+            job_id = product_broker.publish(job_data)
 
-            wp_product = wp_module.create_product(**product_data)
-            # job_id = product_broker.publish(product_data)
-
-            await update.message.reply_text(f"✅ محصول برای ساخت ارسال شد (wp_product={wp_product})")
+            await update.message.reply_text(
+                f"✅ محصول برای ساخت ارسال شد (job_id={job_id.decode()}).\n"
+                "لینک محصول بعد از ساخت برات فرستاده می‌شه."
+            )
 
             context.user_data.clear()
             await show_main_menu(update)
@@ -190,13 +209,13 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # --- mode of starting the steps ---
     if "step" not in context.user_data:
         if text == "1":
-            init_chain(context, "wordpress", WORDPRESS_STEPS)
+            init_chain(context, "wordpress")
             await ask_current_question(update, context)
         elif text == "2":
-            init_chain(context, "product", PRODUCT_STEPS)
+            init_chain(context, "product")
             await ask_current_question(update, context)
         elif text == "3":
-            init_chain(context, "article", ARTICLE_STEPS)
+            init_chain(context, "article")
             await ask_current_question(update, context)
         else:
             await update.message.reply_text("لطفاً فقط 1 یا 2 یا 3 رو انتخاب کن.")
@@ -204,7 +223,7 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     step = context.user_data["step"]
     sub = context.user_data["substep"]
-    steps = context.user_data["steps"]
+    steps = current_steps(context)
     key = steps[sub][0]
 
     # Normalize the price
@@ -256,69 +275,191 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await show_main_menu(update)
 
 # -------- HANDLE FILE/PHOTO --------
+# Downloads and WordPress uploads run as background tasks, the blocking upload itself
+# on upload_executor, so the event loop keeps serving other users meanwhile. Images are
+# held in memory only (nothing is written to disk); upload_slots bounds how many at once.
+upload_executor = ThreadPoolExecutor(max_workers=Config.TELEGRAM_UPLOAD_CONCURRENCY, thread_name_prefix="tg_upload")
+upload_slots = asyncio.Semaphore(Config.TELEGRAM_UPLOAD_CONCURRENCY)
+# user id -> {album id: progress} so an album gets one completion report
+# (per replica: photos of an album handled by different replicas are reported separately)
+album_progress = defaultdict(dict)
+
+
+async def upload_image(file, filename):
+    """Download one image into memory and upload it to the media library; returns the media or None"""
+    async with upload_slots:
+        data = bytes(await file.download_as_bytearray())
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(upload_executor, wp_client.upload_media_bytes, data, filename)
+
+
+async def report_upload(message, user_id, album_id, task):
+    progress = album_progress[user_id][album_id]
+    try:
+        media = await task
+    except Exception as e:
+        media = None
+        progress["errors"].append(str(e))
+    if media:
+        progress["urls"].append(media["source_url"])
+        progress["reused"] += media["reused"]
+    elif not progress["errors"]:
+        progress["errors"].append("upload failed")
+    progress["pending"] -= 1
+    if progress["pending"]:
+        return
+
+    del album_progress[user_id][album_id]
+    lines = []
+    if progress["urls"]:
+        lines.append(f"🖼 {len(progress['urls'])} تصویر در وردپرس آماده است ({progress['reused']} مورد از قبل موجود بود):")
+        lines.extend(progress["urls"])
+    if progress["errors"]:
+        lines.append(f"⚠️ خطای آپلود: {progress['errors'][0]}")
+    if progress["for_product"] and progress["urls"]:
+        lines.append("📸 به گالری محصول اضافه شد. می‌تونی ادامه بدی یا «پایان» رو بفرستی.")
+    await message.reply_text("\n".join(lines))
+
+
+async def record_image(user_id, message_id, task):
+    """Record a product image's URL in the user's conversation once its upload is done"""
+    try:
+        media = await task
+    except Exception:
+        media = None
+    await conversations.image_finished(user_id, message_id, media and media["source_url"])
+
+
+async def collect_images(update, context):
+    """Wait for the user's running uploads, on any replica, and add their URLs to the product in message order"""
+    user_id = update.effective_user.id
+    running = await conversations.pending_images(user_id)
+    if running:
+        await update.message.reply_text(f"⏳ منتظر آپلود {running} تصویر...")
+    images = context.user_data["data"].setdefault("images", [])
+    for url in await conversations.collect_images(user_id):
+        if url not in images:
+            images.append(url)
+
+
+@with_conversation
 async def handle_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    file_path = None
-    media_url = None
+    message = update.message
 
     # Receive photos from Telegram
-    if update.message.photo:
-        photo = update.message.photo[-1]
-        file = await photo.get_file()
-        file_path = os.path.join(UPLOAD_DIR, f"{file.file_id}.jpg")
-        await file.download_to_drive(file_path)
-
-    elif update.message.document:
-        doc = update.message.document
+    if message.photo:
+        file = await message.photo[-1].get_file()
+        filename = f"{file.file_id}.jpg"
+    elif message.document:
+        doc = message.document
         if not doc.mime_type.startswith("image/"):
-            await update.message.reply_text("⚠️ فقط فایل تصویری مجاز است.")
+            await message.reply_text("⚠️ فقط فایل تصویری مجاز است.")
             return
         file = await doc.get_file()
-        ext = os.path.splitext(doc.file_name)[-1]
-        file_path = os.path.join(UPLOAD_DIR, f"{doc.file_id}{ext}")
-        await file.download_to_drive(file_path)
-
-    if not file_path:
+        ext = os.path.splitext(doc.file_name or "")[-1]
+        filename = f"{doc.file_id}{ext}"
+    else:
         return
 
-    await update.message.reply_text(f"🖼 تصویر ذخیره شد: {os.path.basename(file_path)}")
+    if not (Config.WORDPRESS_USER and Config.WORDPRESS_PASSWORD and Config.WORDPRESS_URL):
+        await message.reply_text("⚠️ اطلاعات وردپرس تنظیم نشده، تصویر آپلود نشد.")
+        return
 
-    # Direct upload to WordPress (Media Library)
-    wp_user = Config.WORDPRESS_USER
-    wp_pass = Config.WORDPRESS_PASSWORD
-    wp_url = Config.WORDPRESS_URL
+    user_id = update.effective_user.id
+    album_id = message.media_group_id or f"msg{message.message_id}"
+    for_product = context.user_data.get("step") == "awaiting_images"
+    progress = album_progress[user_id].get(album_id)
+    if progress is None:
+        progress = album_progress[user_id][album_id] = {
+            "pending": 0, "urls": [], "reused": 0, "errors": [], "for_product": for_product,
+        }
+        await message.reply_text("📥 دریافت شد، در حال آپلود به وردپرس...")
+    progress["pending"] += 1
+
+    task = asyncio.ensure_future(upload_image(file, filename))
+    if for_product:
+        await conversations.image_started(user_id, message.message_id)
+        context.application.create_task(record_image(user_id, message.message_id, task), update=update)
+    context.application.create_task(report_upload(message, user_id, album_id, task), update=update)
+
+# -------- PRODUCT RESULTS --------
+RESULT_STREAM = "product_results"
+RESULT_GROUP = "telegram_bot"
+RESULT_CLAIM_IDLE = 60000  # ms a delivery may stay unacked before any bot process retries it
+
+
+async def notify_results(application, results, entries):
+    """Send each result to its chat; a result whose message could not be sent stays pending for a retry"""
+    for entry_id, result in entries:
+        if result is None:
+            # trimmed from the stream; ack it, or Redis 6.2's XAUTOCLAIM keeps handing it back
+            await results.xack(RESULT_STREAM, RESULT_GROUP, entry_id)
+            continue
+        if result.get("status") == "done":
+            text = f"✅ محصول «{result.get('title')}» ساخته شد:\n{result.get('permalink') or result.get('product_id')}"
+        else:
+            text = f"❌ ساخت محصول «{result.get('title')}» ناموفق بود: {result.get('error')}"
+        try:
+            await application.bot.send_message(chat_id=int(result["chat_id"]), text=text)
+        except (Forbidden, BadRequest) as e:
+            logging.error(f"Dropping result for chat {result.get('chat_id')}: {e}")  # blocked the bot or gone; a retry can't help
+        except Exception as e:
+            logging.error(f"Could not notify chat {result.get('chat_id')}, will retry: {e}")
+            continue
+        await results.xack(RESULT_STREAM, RESULT_GROUP, entry_id)
+
+
+async def reclaim_results(application, results, consumer):
+    """Deliver results that were read (by any bot process, this one included) but not acked for a while"""
+    cursor = "0-0"
+    while True:
+        claimed = await results.xautoclaim(RESULT_STREAM, RESULT_GROUP, consumer, RESULT_CLAIM_IDLE, cursor, count=100)
+        await notify_results(application, results, claimed[1])
+        cursor = claimed[0]
+        if cursor == "0-0":
+            return
 
-    if wp_user and wp_pass and wp_url:
-        media_endpoint = f"{wp_url}/wp-json/wp/v2/media"
-        mime_type, _ = mimetypes.guess_type(file_path)
-        mime_type = mime_type or "application/octet-stream"
 
+async def listen_results(application):
+    """Push finished product jobs back to the chat that submitted them"""
+    results = aioredis.Redis.from_url(Config.REDIS_URL, decode_responses=True)
+    try:
+        await results.xgroup_create(RESULT_STREAM, RESULT_GROUP, id="0", mkstream=True)
+    except redis.exceptions.ResponseError:
+        pass  # group already exists
+    consumer = consumer_name("telegram_bot")
+
+    last_reclaim = None
+    while True:
+        # results a previous bot process read but never delivered, and our own failed sends
+        if last_reclaim is None or asyncio.get_running_loop().time() - last_reclaim >= Config.RECLAIM_INTERVAL:
+            last_reclaim = asyncio.get_running_loop().time()
+            try:
+                await reclaim_results(application, results, consumer)
+            except redis.exceptions.RedisError as e:
+                logging.error(f"Result stream claim failed: {e}")
         try:
-            headers = {"User-Agent": "Mozilla/5.0"}
-            with open(file_path, "rb") as f:
-                files = {"file": (os.path.basename(file_path), f, mime_type)}
-                resp = requests.post(media_endpoint, files=files, auth=HTTPBasicAuth(wp_user, wp_pass), headers=headers)
-
-            if resp.status_code in (200, 201):
-                media_data = resp.json()
-                media_url = media_data.get("source_url")
-                await update.message.reply_text(f"🖼 تصویر در وردپرس آپلود شد: {media_url}")
-            else:
-                await update.message.reply_text(f"⚠️ خطا در آپلود به وردپرس ({resp.status_code}): {resp.text}")
-        except Exception as e:
-            await update.message.reply_text(f"⚠️ خطای آپلود: {str(e)}")
+            response = await results.xreadgroup(RESULT_GROUP, consumer, {RESULT_STREAM: ">"}, count=20, block=5000)
+        except redis.exceptions.RedisError as e:
+            logging.error(f"Result stream read failed: {e}")
+            await asyncio.sleep(2)
+            continue
+        for _, entries in response or []:
+            await notify_results(application, results, entries)
+
+
+result_listener = None
+
+
+async def start_result_listener(application):
+    global result_listener
+    result_listener = asyncio.create_task(listen_results(application))
 
-    # Add image to context.user_data for product
-    if context.user_data.get("step") == "awaiting_images" and media_url:
-        data = context.user_data.setdefault("data", {})
-        images = data.setdefault("images", [])
-        if media_url not in images:
-            images.append(media_url)
-            await update.message.reply_text("📸 تصویر به گالری محصول اضافه شد. می‌تونی ادامه بدی یا «پایان» رو بفرستی.")
 
 # -------- MAIN --------
 if __name__ == "__main__":
-    tg = TelegramClient()
+    tg = TelegramClient(post_init=start_result_listener)
     tg.add_handler(CommandHandler("start", start))
     tg.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
     tg.add_handler(MessageHandler(filters.PHOTO | filters.Document.IMAGE, handle_file))
-    tg.app.run_polling(poll_interval=5, timeout=30, drop_pending_updates=True)
+    tg.run()